@@ -1,7 +1,13 @@
 
+import sqlite3
+import types
+
+import pytest
+
 import zope.interface
-from textgame.db import IDatabaseBackend
+from textgame.db import IDatabaseBackend, Database
 from textgame.db.backends import Sqlite
+from textgame.db.backends.schema.SqliteSchema import Schema
 
 
 class TestSqlite:
@@ -11,3 +17,343 @@ class TestSqlite:
 
     def test_interface(self):
         assert IDatabaseBackend.implementedBy(Sqlite.Sqlite)
+
+    def test_pragmas(self, tmp_path):
+        db = Sqlite.Sqlite(str(tmp_path / "world.db"))
+        try:
+            assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert db.conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+            assert db.conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+            assert db.conn.execute("PRAGMA foreign_key_check").fetchall() == []
+            assert db.conn.execute("PRAGMA journal_size_limit").fetchone()[0] == 67108864
+        finally:
+            db.close()
+
+    def test_readers_see_committed_writes(self, tmp_path):
+        db = Sqlite.Sqlite(str(tmp_path / "world.db"))
+        try:
+            assert db._read_pool.qsize() == Sqlite.READ_POOL_SIZE
+            db.set_property(0, 'test', 'value')
+            assert db.get_property(0, 'test') == 'value'
+            with pytest.raises(sqlite3.OperationalError):
+                with db._reader() as conn:
+                    conn.execute("DELETE FROM properties")
+        finally:
+            db.close()
+
+    def test_property_writes_are_buffered(self, tmp_path):
+        db = Sqlite.Sqlite(str(tmp_path / "world.db"))
+        try:
+            db.set_property(0, 'buffered', 'value')
+            assert db.get_property(0, 'buffered') == 'value'
+            query = "SELECT value FROM properties WHERE obj==0 AND key=='buffered'"
+            with db._reader() as conn:
+                assert conn.execute(query).fetchone() is None
+            db.flush()
+            with db._reader() as conn:
+                assert conn.execute(query).fetchone() == ('value',)
+            db.set_properties([(0, 'a', '1'), (1, 'a', '2')])
+            db.flush()
+            assert (db.get_property(0, 'a'), db.get_property(1, 'a')) == ('1', '2')
+        finally:
+            db.close()
+
+    def test_flush_writes_good_rows(self):
+        db = Database('Sqlite', ':memory:')
+        try:
+            # Object #99 doesn't exist, so its property can't be written, but the others still are.
+            db.set_properties([(0, 'a', '1'), (99, 'a', '2'), (1, 'a', '3')])
+            db.flush()
+            assert [db.get_property(obj, 'a') for obj in (0, 99, 1)] == ['1', None, '3']
+        finally:
+            db.close()
+
+    def test_get_properties(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            db.set_property(3, '_/succ', 'changed')
+            props = db.get_properties(3, ['_/desc', '_/succ', '_/none'])
+            assert props == {'_/desc': "There's nothing exciting in that direction.",
+                             '_/succ': 'changed', '_/none': None}
+            assert db.get_property(3, '_/none') is None
+            assert db._prop_cache.hits == 1
+        finally:
+            db.close()
+
+    def test_get_many_properties(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            db.set_property(4, '_/succ', 'You drink the tea.')
+            props = db.get_many_properties([3, 4, 99], ('_/succ', '_/fail'))
+            assert props == {3: {'_/succ': "Life is peaceful there...", '_/fail': "The way is closed."},
+                             4: {'_/succ': 'You drink the tea.', '_/fail': "You can't drink tea that you don't have."},
+                             99: {'_/succ': None, '_/fail': None}}
+            # The values are cached for the next lookup.
+            assert db.get_property(3, '_/fail') == "The way is closed."
+            assert db._prop_cache.hits == 1
+        finally:
+            db.close()
+
+    def test_read_cache(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            assert db.get_property(0, 'cached') is None
+            assert db.get_property(0, 'cached') is None
+            assert (db._prop_cache.hits, db._prop_cache.misses) == (1, 1)
+            db.set_property(0, 'cached', 'value')
+            db.flush()
+            assert db.get_property(0, 'cached') == 'value'
+            assert db.load_object(0) is db.load_object(0)
+        finally:
+            db.close()
+
+    def test_user_queries(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            db.set_password('someone', b'hash', b'salt')
+            assert db.get_user('someone') == (b'hash', b'salt')
+            assert db.get_user_characters('someone') == []
+            assert db.get_player_id('someone', 'Nobody') is None
+        finally:
+            db.close()
+
+    def test_checkpoint_truncates_wal(self, tmp_path):
+        db = Sqlite.Sqlite(str(tmp_path / "world.db"))
+        try:
+            db.set_property(0, 'test', 'value')
+            db.checkpoint()
+            assert (tmp_path / "world.db-wal").stat().st_size == 0
+            assert db.get_property(0, 'test') == 'value'
+        finally:
+            db.close()
+
+    def test_close_truncates_wal(self, tmp_path):
+        db = Sqlite.Sqlite(str(tmp_path / "world.db"))
+        # Another connection stops Sqlite from removing the WAL by itself when the database is closed.
+        other = sqlite3.connect(str(tmp_path / "world.db"))
+        try:
+            other.execute("SELECT 1 FROM meta").fetchone()
+            db.set_property(0, 'test', 'value')
+            db.close()
+            assert (tmp_path / "world.db-wal").stat().st_size == 0
+            assert other.execute("SELECT value FROM properties WHERE obj=0 AND key='test'").fetchone() == ('value',)
+        finally:
+            other.close()
+
+    def test_create_character(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            assert db.create_character('creator', 'Someone') == 6
+            assert db.create_character('creator', 'someone') is None
+            assert db.get_player_id('creator', 'Someone') == 6
+            # Deleted IDs are reused, and lose their old properties.
+            db._write(lambda conn: conn.execute("INSERT INTO deleted VALUES (2)"))
+            assert db.get_property(2, '_/desc') is not None
+            assert db.create_character('creator', 'Another') == 2
+            assert db.load_object(2)[:6] == (1, 'Another', 0, 0, 2, None)
+            assert db.get_property(2, '_/desc') is None
+            with db._reader() as conn:
+                assert conn.execute("SELECT count(*) FROM deleted").fetchone() == (0,)
+        finally:
+            db.close()
+
+    def test_reused_player_id_loses_its_user(self, tmp_path):
+        db = Database('Sqlite', str(tmp_path / "world.db"))
+        other = sqlite3.connect(str(tmp_path / "world.db"))
+        try:
+            db.create_account('someone', 'password', 'Someone')
+            assert db.get_player_id('someone', 'Someone') == 6
+            # Delete the Player, and have another user create a character that takes its ID.
+            with other:
+                other.execute("INSERT INTO deleted VALUES (6)")
+            db.create_account('other', 'password', 'Another')
+            assert db.get_player_id('other', 'Another') == 6
+            assert db.get_user_characters('someone') == []
+        finally:
+            other.close()
+            db.close()
+
+    def test_failed_write_is_rolled_back_alone(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            def fail(conn):
+                conn.execute("INSERT INTO deleted VALUES (3)")
+                raise sqlite3.IntegrityError("failed")
+            db._write(lambda conn: conn.execute("INSERT INTO deleted VALUES (2)"))
+            with pytest.raises(sqlite3.IntegrityError):
+                db._write(fail, wait=True)
+            with db._reader() as conn:
+                assert conn.execute("SELECT obj FROM deleted").fetchall() == [(2,)]
+        finally:
+            db.close()
+
+    def test_writer_survives_failed_transaction(self, tmp_path, monkeypatch):
+        # Give up on the write lock straight away, rather than waiting for it.
+        monkeypatch.setattr(Sqlite, 'PRAGMAS', Sqlite.PRAGMAS + ("PRAGMA busy_timeout = 0",))
+        db = Database('Sqlite', str(tmp_path / "world.db"))
+        other = sqlite3.connect(str(tmp_path / "world.db"), isolation_level=None)
+        try:
+            # While another connection holds the write lock, the whole batch fails.
+            other.execute("BEGIN IMMEDIATE")
+            with pytest.raises(sqlite3.OperationalError):
+                db.create_account('someone', 'password', 'Someone')
+            other.execute("ROLLBACK")
+            # But the writer is still running, and readers aren't left waiting on the failed batch.
+            db.create_account('someone', 'password', 'Someone')
+            assert db.get_player_id('someone', 'Someone') == 6
+        finally:
+            other.close()
+            db.close()
+
+    def test_closed_database_raises(self):
+        db = Database('Sqlite', ':memory:')
+        db.close()
+        # Reads that don't check for a connection first must not wait forever for a reader.
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.get_contents(0)
+
+    def test_load_objects(self, monkeypatch):
+        monkeypatch.setattr(Sqlite, 'MAX_IN_PARAMS', 2)
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            db.set_property(2, '_/desc', 'A cup of tea.')
+            db.flush()
+            rows = db.load_objects([0, 1, 2, 3, 99])
+            assert sorted(rows) == [0, 1, 2, 3]
+            assert rows[0][4] == 1  # The Universe is owned by The Creator
+            assert rows[2] == db.load_object(2)
+            # Descriptions are loaded along with the objects.
+            assert db._prop_cache.get((2, '_/desc')) == 'A cup of tea.'
+            assert db._prop_cache.get((99, '_/desc')) is Sqlite._LRUCache.MISSING
+            # But never replace a newer description that hasn't been flushed yet.
+            db.set_property(2, '_/desc', 'An empty cup.')
+            db._object_cache.invalidate(2)
+            db.load_object(2)
+            db.flush()
+            assert db.get_property(2, '_/desc') == 'An empty cup.'
+        finally:
+            db.close()
+
+    def test_cached_objects_load_without_a_reader(self):
+        db = Sqlite.Sqlite(':memory:')
+        rows = db.load_objects([0, 1])
+        db.close()
+        # Cached objects are served without checking out a reader, which a closed database no longer has.
+        assert db.load_objects([0, 1]) == rows
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.load_objects([2])
+
+    def test_save_object_writes_changed_fields(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            # Item #2 is in #1, and owned by #1.
+            ref = types.SimpleNamespace
+            thing = ref(id=2, dbtype=2, name='some tea', flags=0, money=0, modified=10, lastused=10,
+                        parent=ref(id=0), owner=ref(id=0), link=None, _dirty_fields={'name', 'parent'})
+            db.save_object(thing)
+            assert db.load_object(2)[1:5] == ('some tea', 0, 0, 1)
+            thing._dirty_fields = {'owner'}
+            db.save_object(thing)
+            assert db.load_object(2)[3:6] == (0, 0, None)
+            # Saves are buffered, and the fields changed by each are combined.
+            thing.name, thing.parent, thing._dirty_fields = 'tea', ref(id=1), {'parent'}
+            db.save_object(thing)
+            thing._dirty_fields = {'name'}
+            db.save_object(thing)
+            assert len(db._save_buffer) == 1
+            assert db.load_object(2)[1:4] == ('tea', 0, 1)
+            # With nothing changed, only the timestamps are written.
+            thing.name, thing.lastused, thing._dirty_fields = 'unsaved', 20, set()
+            db.save_object(thing)
+            assert db.load_object(2)[1] == 'tea'
+            assert db.load_object(2)[9] == 20
+        finally:
+            db.close()
+
+    def test_property_lookup_is_index_only(self, tmp_path):
+        db = Sqlite.Sqlite(str(tmp_path / "world.db"))
+        try:
+            plan = db.conn.execute("EXPLAIN QUERY PLAN " + Sqlite.SQL_GET_PROPERTY, (0, '_/desc')).fetchall()
+            # properties is clustered on its primary key, so the value is read from the index itself.
+            assert "USING PRIMARY KEY" in plan[0][3]
+        finally:
+            db.close()
+
+    def test_lookups_use_keys(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            plan = db.conn.execute("EXPLAIN QUERY PLAN " + Sqlite.SQL_GET_USER, ('creator',)).fetchall()
+            assert "sqlite_autoindex_users_1" in plan[0][3]
+            plan = db.conn.execute("EXPLAIN QUERY PLAN SELECT obj FROM deleted ORDER BY obj LIMIT 1").fetchall()
+            assert all("TEMP B-TREE" not in row[3] for row in plan)
+        finally:
+            db.close()
+
+    def test_contents_lookup_is_index_only(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            plan = db.conn.execute("EXPLAIN QUERY PLAN " + Sqlite.SQL_GET_CONTENTS, (0,)).fetchall()
+            assert "USING COVERING INDEX parent_index" in plan[0][3]
+            plan = db.conn.execute("EXPLAIN QUERY PLAN " + Sqlite.SQL_GET_CONTENTS_WITH_FLAGS, (0,)).fetchall()
+            assert "USING COVERING INDEX parent_index" in plan[0][3]
+            assert sorted(db.get_contents_with_flags(0)) == [(0, 0, 0), (1, 1, 0), (3, 3, 0), (5, 1, 0)]
+            plan = db.conn.execute("EXPLAIN QUERY PLAN " + Sqlite.SQL_GET_CONTENTS_BY_TYPE, (0, 3)).fetchall()
+            assert "USING COVERING INDEX parent_index" in plan[0][3]
+            assert db.get_contents_by_type(0, 3) == [3]
+        finally:
+            db.close()
+
+    def test_action_cache(self):
+        db = Sqlite.Sqlite(':memory:')
+        try:
+            assert db.get_contents_by_type(0, Sqlite.ACTION_TYPE) == [3]
+            assert db.get_contents_by_type(0, Sqlite.ACTION_TYPE) == [3]
+            assert db._action_cache.hits == 1
+            # Moving an Action (#3 is in #0, and owned by #1) drops the cached lists.
+            ref = types.SimpleNamespace
+            action = ref(id=3, dbtype=3, name='west', flags=0, money=0, modified=10, lastused=10,
+                         parent=ref(id=1), owner=ref(id=1), link=ref(id=0), _dirty_fields={'parent'})
+            db.save_object(action)
+            assert db.get_contents_by_type(0, Sqlite.ACTION_TYPE) == []
+            assert db.get_contents_by_type(1, Sqlite.ACTION_TYPE) == [3]
+        finally:
+            db.close()
+
+    def test_upgrade(self, tmp_path):
+        path = str(tmp_path / "world.db")
+        Sqlite.Sqlite(path).close()
+        # Turn the new database back into a version 0 database.
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE meta SET value=0 WHERE key='schema_version'")
+        conn.execute("DROP TRIGGER reuse_deleted")
+        conn.execute("DROP TABLE properties")
+        conn.execute("CREATE TABLE properties (obj INTEGER, key TEXT, value TEXT)")
+        conn.execute("CREATE UNIQUE INDEX key_index ON properties(obj, key)")
+        conn.execute("INSERT INTO properties VALUES (0, 'test', 'kept')")
+        conn.execute("DROP TABLE deleted")
+        conn.execute("CREATE TABLE deleted (obj INTEGER, FOREIGN KEY(obj) REFERENCES object(id))")
+        conn.execute("INSERT INTO deleted VALUES (3)")
+        conn.execute("UPDATE objects SET created=created+0.5")
+        conn.execute("DROP TABLE characters")
+        conn.execute("CREATE TABLE characters (username TEXT, obj INTEGER)")
+        conn.executemany("INSERT INTO characters VALUES (?, ?)", [("creator", 1)] * 3)
+        conn.commit()
+        conn.close()
+
+        db = Sqlite.Sqlite(path)
+        try:
+            assert db.get_property(0, 'test') == 'kept'
+            sql = db.conn.execute("SELECT sql FROM sqlite_master WHERE name='properties'").fetchone()[0]
+            assert "WITHOUT ROWID" in sql
+            assert db.conn.execute("SELECT obj FROM deleted").fetchall() == [(3,)]
+            assert db.conn.execute("PRAGMA foreign_key_list(deleted)").fetchone()[2] == 'objects'
+            trigger = db.conn.execute("SELECT sql FROM sqlite_master WHERE name='reuse_deleted'").fetchone()[0]
+            assert "DELETE FROM characters" in trigger
+            assert db.get_user_characters('creator') == ['The Creator']
+            assert db.conn.execute("SELECT count(*) FROM characters").fetchone() == (1,)
+            kinds = db.conn.execute("SELECT DISTINCT typeof(created) FROM objects").fetchall()
+            assert kinds == [("integer",)]
+            version = db.conn.execute("SELECT value FROM meta WHERE key='schema_version'").fetchone()[0]
+            assert version == len(Schema.upgrades)
+        finally:
+            db.close()
@@ -0,0 +1,39 @@
+from textgame.Things import Action
+from textgame.World import World
+
+
+class TestWorld:
+    """
+    Tests the World class.
+    """
+
+    def test_find_actions_after_changing_an_action(self):
+        world = World('Sqlite', ':memory:')
+        try:
+            room, drink = world.get_thing(0), world.get_thing(4)
+            assert [x.id for x in world.find_actions(room, 'd')] == []
+            # Move the drink action (#4) into the room. Searching before it is saved rebuilds the
+            # index from the old rows, and saving it must not leave that index behind.
+            drink.parent = room
+            world.find_actions(room, 'd')
+            drink.save()
+            assert [x.id for x in world.find_actions(room, 'd')] == [4]
+            # Renaming an Action takes effect straight away.
+            world.get_thing(3).name = 'down'
+            assert sorted(x.id for x in world.find_actions(room, 'd')) == [3, 4]
+            assert world.find_actions(room, 'w') == []
+        finally:
+            world.close()
+
+    def test_action_messages_are_precached(self, monkeypatch):
+        world = World('Sqlite', ':memory:')
+        try:
+            west, = world.get_contents(world.get_thing(0), Action)
+            # Loading the Action fetched its messages, so reading them doesn't need the database.
+            monkeypatch.setattr(world.db, 'get_property', None)
+            assert (west['_/succ'], west['_/fail']) == ("Life is peaceful there...", "The way is closed.")
+            monkeypatch.undo()
+            west['_/succ'] = "Onwards."
+            assert west['_/succ'] == world.db.get_property(3, '_/succ') == "Onwards."
+        finally:
+            world.close()
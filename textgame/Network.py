@@ -1,4 +1,5 @@
 import enum
+import functools
 import socket
 import struct
 import textwrap
@@ -115,8 +116,28 @@ class BasicUserSession(protocol.Protocol):
                 logger.info(f"{self.host} lost connection: {reason.getErrorMessage()}")
 
 
+def _prefer(preferred: typing.Iterable[bytes], supported: typing.Iterable[bytes]) -> List[bytes]:
+    """
+    Returns the algorithms from preferred which are also in supported, in order of preference.
+    """
+    supported = set(supported)
+    return [name for name in preferred if name in supported]
+
+
 class CleanSSHServerTransport(twisted.conch.ssh.transport.SSHServerTransport):
 
+    # Conch performs its symmetric crypto through the OpenSSL backend of the cryptography package, so we
+    # prefer algorithms that OpenSSL can run on hardware instructions (AES-NI, SHA-NI). The AEAD ciphers are
+    # listed first so that they are picked up if Conch gains support for them; anything Conch does not
+    # implement is filtered out. The slow legacy ciphers (3des-cbc, the CBC modes) are not offered at all.
+    supportedCiphers = _prefer(
+        (b'aes128-gcm@openssh.com', b'chacha20-poly1305@openssh.com', b'aes128-ctr', b'aes256-ctr'),
+        twisted.conch.ssh.transport.SSHServerTransport.supportedCiphers)
+
+    supportedMACs = _prefer(
+        (b'hmac-sha2-256', b'hmac-sha2-512'),
+        twisted.conch.ssh.transport.SSHServerTransport.supportedMACs)
+
     @property
     def peer(self) -> str:
         """Peer address as a string."""
@@ -161,10 +182,13 @@ class SSHShellOnlyConnection(connection.SSHConnection):
         return super().ssh_CHANNEL_REQUEST(packet)
 
 
+@functools.lru_cache(maxsize=None)
 def get_rsa_server_keys() -> Tuple[keys.Key, keys.Key]:
     """
     Gets the SSH RSA private and public keys, generating them if they do not exist.
 
+    The keys are only read from disk once; every later call returns the same pair.
+
     :return: A tuple of (private key, public key).
     """
     try:
@@ -1,8 +1,9 @@
 
-from zope.interface import implements, implementer
+from zope.interface import implementer
 
 from twisted.conch import recvline
 from twisted.conch.insults import insults
+from twisted.internet import reactor
 
 import string
 
@@ -43,6 +44,9 @@ class TextUI(recvline.HistoricRecvLine, Loggable):
     def __init__(self, user=None, width=80, height=24):
         recvline.HistoricRecvLine.__init__(self)
         self.scrollback = []
+        # Lines written since the last frame was drawn, and the pending call that will draw them.
+        self._pending_lines = []
+        self._flush_handle = None
         self.user = user
         self.width = width
         self.height = height
@@ -58,6 +62,12 @@ class TextUI(recvline.HistoricRecvLine, Loggable):
         self.keyHandlers['\x0c'] = self.handle_CTRL_L # Redraws the screen
         #self.write_line("Debug: SSHProtocol welcomes you")
 
+    def connectionLost(self, reason):
+        if self._flush_handle is not None and self._flush_handle.active():
+            self._flush_handle.cancel()
+        self._flush_handle = None
+        recvline.HistoricRecvLine.connectionLost(self, reason)
+
     def initializeScreen(self):
         self.terminal.reset()
         self.redraw()
@@ -132,7 +142,7 @@ class TextUI(recvline.HistoricRecvLine, Loggable):
 
     def lineReceived(self, line: bytes):
         line = line.decode("utf-8", errors="replace")
-        log(LogLevel.Debug, "Received line: {0}".format(line))
+        log(LogLevel.Debug, "Received line: %s", line)
         try:
             self.user.process_line(line)
         except Exception as e:
@@ -148,17 +158,34 @@ class TextUI(recvline.HistoricRecvLine, Loggable):
         """
         Writes a line to the screen on the line above the input line,
         pushing existing lines upwards.
+
+        The line is not drawn immediately. All lines written during the
+        current reactor iteration are drawn together by _flush_frame().
         """
         if len(self.scrollback) > 500:
             self.scrollback.pop(0)
         self.scrollback.append(line)
 
+        self._pending_lines.append(line)
+        if self._flush_handle is None:
+            self._flush_handle = reactor.callLater(0, self._flush_frame)
+
+    def _flush_frame(self):
+        """
+        Draws all pending lines in a single save cursor / print / restore cursor sequence.
+        """
+        self._flush_handle = None
+        lines, self._pending_lines = self._pending_lines, []
+        if not lines:
+            return
+
         self.terminal.saveCursor()
         self.terminal.setScrollRegion(0, self.height - 4)
 
         self._cpos_print()
-        self.terminal.nextLine()
-        self.terminal.write(line)
+        for line in lines:
+            self.terminal.nextLine()
+            self.terminal.write(line)
 
         self.terminal.setScrollRegion(self.height - 2, self.height)
         self.terminal.restoreCursor()
@@ -177,6 +204,8 @@ class TextUI(recvline.HistoricRecvLine, Loggable):
         Redraws the screen, restoring scrollback and current input line.
         Should be used when screen size changes.
         """
+        # Pending lines are already in the scrollback, which is redrawn in full.
+        self._pending_lines = []
         self.terminal.eraseDisplay()
         self.terminal.setScrollRegion(0, self.height - 4)
         self.restore_scrollback()
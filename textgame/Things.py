@@ -5,15 +5,24 @@ import time
 class Thing(object):
     """Represents a database object."""
 
+    # Many Things can be loaded at once, so they don't get an instance dict.
+    __slots__ = ('world', '_propcache', '_propdirty', '_obj', 'name', '_name_lower', 'flags', 'money',
+                 '_created', '_modified', '_lastused', 'owner', 'parent', 'link', '_dirty_fields')
+
     # Editable database attributes
     dbattrs = ('name', 'flags', 'parent', 'owner', 'link', 'money')
     msgattrs = ('desc', 'succ', 'fail', 'osucc', 'ofail', 'drop')
+    # The dbattrs as a set, for the membership test on every attribute assignment
+    _tracked = frozenset(dbattrs)
+    # Properties that are fetched together when the Thing is loaded. Anything else,
+    # including the description, is fetched the first time that it is used.
+    precache = ()
 
     # Basic properties
 
     def __init__(self, world, obj, name, flags,
             parent_id, owner_id, link_id, money,
-            created, modified, lastused):
+            created, modified, lastused, props=None):
 
         # Slot for a reference to the world instance.
         self.world = world
@@ -26,14 +35,33 @@ class Thing(object):
         self._obj, self.name, self.flags, self.money = (obj, name, flags, money)
         self._created, self._modified, self._lastused = (created, modified, lastused) ###
 
-        # Precache our description
-        self._propcache['_/desc'] = world.db.get_property(obj, '_/desc')
+        # Precache any properties that we'll probably need, unless they were loaded along with us
+        if props is not None:
+            self._propcache.update(props)
+        elif self.precache:
+            self._propcache.update(world.db.get_properties(obj, self.precache))
 
         self.owner = world.get_thing(owner_id)
         self.parent = world.get_thing(parent_id)
         self.link = world.get_thing(link_id) if link_id is not None else None
 
-        log(LogLevel.Trace, 'A new Thing was instantiated with (ID:{0}) (name:{1}) (parentID:{2})'.format(self._obj, self.name, self.parent.id))
+        # Names of the dbattrs that have been changed since the last save.
+        self._dirty_fields = set()
+
+        log(LogLevel.Trace, 'A new Thing was instantiated with (ID:%s) (name:%s) (parentID:%s)', self._obj, self.name, self.parent.id)
+
+    def __setattr__(self, name, value):
+        # Keep track of which database attributes have been changed, so that only those need saving.
+        if name in self._tracked:
+            if name == 'name':
+                # Names are matched case-insensitively, so keep a lowercase copy to match against.
+                object.__setattr__(self, '_name_lower', value.lower())
+            try:
+                self._dirty_fields.add(name)
+            except AttributeError:
+                # Still in __init__, so the Thing is only being loaded.
+                pass
+        object.__setattr__(self, name, value)
 
     def __repr__(self):
         return "<{0}#{1} at 0x{2:08x}>".format(type(self).__name__, self._obj, id(self))
@@ -82,13 +110,12 @@ class Thing(object):
     @property
     def desc(self):
         "Gets the description of this Thing."
-        # We assume that _desc was pre-cached
-        return self._propcache['_/desc']
+        return self['_/desc']
 
     @desc.setter
     def desc(self, value):
         self.world.db.set_property(self._obj, '_/desc', value)
-        self._propcache['/desc'] = value
+        self._propcache['_/desc'] = value
 
     @property
     def created(self):
@@ -109,7 +136,7 @@ class Thing(object):
     def contents(self):
         """Retrieves a list of objects contained in this object."""
         items = self.world.get_contents(self)
-        log(LogLevel.Trace, "Obtained contents for {0}: {1}".format(repr(self), repr(items)))
+        log(LogLevel.Trace, "Obtained contents for %r: %r", self, items)
         return items
 
     def get_desc_for(self, looker):
@@ -119,7 +146,7 @@ class Thing(object):
         vary depending who is looking at this object.
         """
         #in future put extra processing here
-        return self.desc if self.desc else "You see nothing special."
+        return self.desc or "You see nothing special."
     
     def hasflag(self, flag):
         # TODO: Implement this!
@@ -132,37 +159,42 @@ class Player(Thing):
     
     A Player's contents is their inventory - the items they are carrying. They can carry anything except Rooms.
     """
+    __slots__ = ()
 
-    def __init__(self, *params):
-        Thing.__init__(self, *params)
+    def __init__(self, *params, **kwargs):
+        Thing.__init__(self, *params, **kwargs)
         log(LogLevel.Debug, 'A new Player object was instantiated!')
 
     def look(self, exit=None):
         """Returns a text description of this player's surroundings,
         or of a particular exit if specified."""
-        if exit is None: return "You see {0}.\r\n{1}\r\nExits: {2}".format(self.parent.name, self.parent.get_desc_for(self),
-                ', '.join([x.name for x in self.parent.contents if x.type is Action]))
+        if exit is None:
+            parent = self.parent
+            return "You see {0}.\r\n{1}\r\nExits: {2}".format(parent.name, parent.get_desc_for(self),
+                ', '.join([x.name for x in self.world.get_contents(parent, Action)]))
         if exit.lower() == 'me': return "You see {0}.\r\n{1}".format(self.name, self.get_desc_for(self))
 
-        stuff = self.parent.contents + self.contents
         return "You can't see that clearly. (Not yet implemented)"
 
 
     def go(self, action):
         """Finds an action named action and executes it."""
         # TODO: Execute actions
-        #actions = filter(lambda x: x.type is Action, self.parent.contents + self.contents)
-        actions = [x for x in self.parent.contents + self.contents if x.type is Action]
         #TODO: Search order
-        log(LogLevel.Trace, "Found actions: {0}".format(repr(actions)))
-        if exit.startswith('#'):
-            actions = [x for x in actions if exit[1:] == x.id()]
-            #actions = filter(lambda x: exit[1:] == x.id(), actions)
-        else:
-            actions = [x for x in actions if x.name.lower.startswith(exit.lower)]
-            #actions = filter(lambda x: x.name.lower().startswith(exit.lower()), actions)
-        if not actions: return "You can't go that way."
-        elif len(actions) > 1: return "I don't know which one you mean!"
+        by_id = action.startswith('#')
+        key = action[1:] if by_id else action.lower()
+        found = None
+        for container in (self.parent, self):
+            if by_id:
+                matches = [x for x in self.world.get_contents(container, Action) if key == str(x.id)]
+            else:
+                matches = self.world.find_actions(container, key, 2)
+            for x in matches:
+                # Stop at the second match, as the action is ambiguous
+                if found is not None: return "I don't know which one you mean!"
+                found = x
+        if found is None: return "You can't go that way."
+        log(LogLevel.Trace, "Found action: %r", found)
 
     def find(self, name, types=None):
         """
@@ -190,11 +222,13 @@ class Room(Thing):
     """
     A Room is an object whose primary purpose is to contain other objects.
     """
+    __slots__ = ()
     #def contents(self):
         #pass
 
 class Item(Thing):
     """An item is a generic object that players can manipulate. Anything which isn't a Script, Player, Room or Action is an Item."""
+    __slots__ = ()
 
     def pickup(self, getter):
         pass
@@ -205,12 +239,23 @@ class Item(Thing):
 class Action(Thing):
     """Aaaaaaaaaaaaaa"""
     # ^ I was either drunk or really tired when I wrote this code. TODO: Documentation
+    __slots__ = ()
+
+    # Using an Action shows one of its messages, so fetch those with the description.
+    precache = ('_/desc', '_/succ', '_/fail')
+
+    def __setattr__(self, name, value):
+        Thing.__setattr__(self, name, value)
+        # Renaming or moving a loaded Action makes the World's index of Action names out of date.
+        if (name == 'name' or name == 'parent') and hasattr(self, '_dirty_fields'):
+            self.world.action_index.clear()
 
     def use(self, user):
         # NOTE: What does it mean to "use" an item? Is this item-defined? Check spec
-        log(LogLevel.Trace, "{0} used {1}".format(user, self))
+        log(LogLevel.Trace, "%s used %s", user, self)
 
 class Script(Thing):
+    __slots__ = ()
 
     def run(self, initiator):
         pass
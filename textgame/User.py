@@ -1,5 +1,5 @@
 import logging
-from enum import Enum
+from enum import IntEnum
 
 from twisted.conch import avatar
 from twisted.conch.interfaces import ISession
@@ -15,12 +15,26 @@ ADMINISTRATIVELY_PROHIBITED = 1
 logger = get_logger(__name__)
 
 
-class State(Enum):
+class State(IntEnum):
     New = 0
     Logged_In = 1
 
 
-prelogincmds = []
+# Fixed replies that are sent often, encoded in advance so that send_message() can skip encoding them.
+encoded_replies = {msg: msg.encode('utf8') for msg in (
+    "You're not connected to a character.",
+    "You are already connected.",
+    "You're not allowed to do that.",
+    "Goodbye!",
+    "Nobody else is connected.",
+    "I don't know what that means.",
+    "I don't know which one you mean!",
+)}
+
+# Commands usable before login, mapped straight to their handlers so they can be found with one lookup.
+prelogincmds = {}
+# Commands without an @ prefix that are run straight away, without first looking for an action of the same name.
+prioritycmds = set()
 commands = {}
 
 
@@ -33,11 +47,14 @@ class commandHandler(object): # Decorator
         self.cmds = aliases
         self.kwargs = kwargs
     def __call__(self, f):
-        for cmd in self.cmds:
+        # Commands are case-insensitive, so they are registered in lowercase.
+        cmds = [cmd.lower() for cmd in self.cmds]
+        for cmd in cmds:
             commands[cmd] = f
         if 'prelogin' in self.kwargs and self.kwargs['prelogin']:
-            for cmd in self.cmds:
-                prelogincmds.append(cmd)
+            prelogincmds.update(dict.fromkeys(cmds, f))
+        if 'priority' in self.kwargs and self.kwargs['priority']:
+            prioritycmds.update(cmds)
 
 class commandHelpText(object): # Decorator
     """
@@ -70,13 +87,14 @@ class User(object):
         # The world which the user is joining.
         self.world = world
         # The user begins in the New state.
-        self.state = State.New
+        self.my_state = State.New
 
     def send_message(self, msg):
         """
         Sends a line of text to the user, using the underlying transport.
         """
-        self.transport.write_line(msg.encode('utf8'))
+        data = encoded_replies.get(msg)
+        self.transport.write_line(data if data is not None else msg.encode('utf8'))
 
     def run_command(self, msg):
         """
@@ -97,10 +115,10 @@ class User(object):
         """
         Built in inventory command. Prints a listing of what the character is carrying.
         """
-        if self.my_state.value < State.Logged_In.value:
+        if self.my_state < State.Logged_In:
             self.send_message("You're not connected to a character.")
             return
-        self.send_message("You are carrying: {0}".format(', '.join(map(lambda x: x.name, self.player.contents))))
+        self.send_message("You are carrying: {0}".format(', '.join([x.name for x in self.player.contents])))
 
     @commandHandler('@create', 'create', prelogin=True)
     @commandHelpText("Creates a new character.")
@@ -108,7 +126,7 @@ class User(object):
         """
         Creates a new character.
         """
-        if self.my_state.value > State.New.value:
+        if self.my_state > State.New:
             self.send_message("You are already connected.")
             return
         # _, user, passwd = line.split()
@@ -153,7 +171,7 @@ class User(object):
             return
         self.world.purge_cache(-1)
 
-    @commandHandler('@quit', 'QUIT', prelogin=True)
+    @commandHandler('@quit', 'QUIT', prelogin=True, priority=True)
     @commandHelpText("Disconnects you completely from the server.")
     def cmd_QUIT(self, params):
         """
@@ -165,7 +183,7 @@ class User(object):
         self.transport.loseConnection()
         return
 
-    @commandHandler('@who', 'WHO', prelogin=True)
+    @commandHandler('@who', 'WHO', prelogin=True, priority=True)
     @commandHelpText("Shows you who is online.")
     def cmd_WHO(self, params):
         """
@@ -199,7 +217,7 @@ class User(object):
         """
         logger.debug("Received connect command from %s", self.transport.getHost().host)
         #log(LogLevel.Debug, "Received connect command from {0}".format(self.transport.getHost().host))
-        if self.my_state > State.New.value:
+        if self.my_state > State.New:
             #Already connected
             self.send_message("You are already connected.")
             return
@@ -228,9 +246,10 @@ class User(object):
             self.send_message("TODO: Help")
             return
         keyword = params[0].lower()
-        if keyword in commands.keys() and hasattr(commands[keyword], 'helptext'):
+        handler = commands.get(keyword)
+        if handler is not None and hasattr(handler, 'helptext'):
             self.send_message('Help for command "{0}":'.format(keyword))
-            self.send_message(commands[keyword].helptext)
+            self.send_message(handler.helptext)
         else:
             self.send_message('There is no help available for "{0}".'.format(keyword))
 
@@ -253,30 +272,32 @@ class User(object):
         # Make them look around and check their inventory
         location = self.player.parent # Get room that the player is in
         self.send_message("Welcome, {0}! You are currently in: {1}\r\n{2}".format(self.player.name, location.name, location.get_desc_for(self.player)))
-        self.send_message("You are carrying: {0}".format(', '.join(map(lambda x: x.name, self.player.contents))))
+        self.send_message("You are carrying: {0}".format(', '.join([x.name for x in self.player.contents])))
      
     def process_line(self, line):
         """
         Processes a line of input from the user.
         """
 
-        if line == '': return
         words = line.split()
-        cmd = words[0]
-        params = words[1:] if len(words) > 1 else []
+        # Nothing to do for an empty (or all whitespace) line
+        if not words: return
+        cmd = words[0].lower()
+        params = words[1:]
 
         # Are we logged in?
-        if self.my_state.value < State.Logged_In.value:
+        if self.my_state < State.Logged_In:
             # Only prelogin commands may be used
-            if words[0] in prelogincmds:
-                commands[words[0]](self, params)
+            handler = prelogincmds.get(cmd)
+            if handler is not None:
+                handler(self, params)
             else:
                 self.send_message("You're not connected to a character.")
             return
 
         # Code execution only proceeds beyond this point on a logged in character.
         # Commands are checked in the following order:
-        # 1. Special prefixes (including @commands and the "say and :pose builtins)
+        # 1. Special prefixes (including @commands and the "say and :pose builtins), and priority builtins
         # 2. Matching actions (in order: player, room, objects in room, and then parent rooms)
         # 3. Builtin commands that do not have a special prefix
 
@@ -295,39 +316,38 @@ class User(object):
             # TODO: Insert code here
             return
 
+        handler = commands.get(cmd)
+
         # If input begins with @, skip looking for actions (an action should never
-        # begin with a @ character). Otherwise...
-        if line[0] != '@':
+        # begin with a @ character). Priority builtins also skip the search. Otherwise...
+        if line[0] != '@' and cmd not in prioritycmds:
+            # These are used for every Thing searched, so look them up once
+            get_contents, find_actions, Item = self.world.get_contents, self.world.find_actions, Things.Item
             # Start the search at the player
             thing = self.player
             while True:
-                logger.trace("Searching %s for %s", thing.name, words[0])
-                # Retrieve a list of Actions contained by this thing, which match the word entered
-                actions = [
-                    x for x in thing.contents
-                    if x.type is Things.Action and x.name.lower().startswith(words[0].lower())
-                ]
-                logger.trace("%r contains %r, matching: %r", thing, thing.contents, actions)
+                logger.trace("Searching %s for %s", thing.name, cmd)
+                # Retrieve a list of Actions contained by this thing, which match the word entered.
+                # Two are enough to know that the command is ambiguous.
+                actions = find_actions(thing, cmd, 2)
+                logger.trace("%r contains matching: %r", thing, actions)
 
                 # Process list, and return if actions were found
                 if self.process_action_list(actions):
                     return
 
-                logger.trace("Searching %s's contents for %s", thing.name, words[0])
+                logger.trace("Searching %s's contents for %s", thing.name, cmd)
 
                 # Retrieve a list of Items contained by this thing, and look for Actions on them.
                 # This is to locate items that are carried by the player, or that are contained in
                 # the same room as the player, or contained in a parent room of the player's room.
-                actions = set()
-
-                # For each Item that the target thing contains:
-                for item in filter(lambda i: i.type is Things.Item, thing.contents):
-                    # For each Action on that Item:
-                    for action in filter(lambda a: a.type is Things.Action, item.contents):
-                        # If the name matches:
-                        if action.name.lower().startswith(words[0].lower()):
-                            # Then add it to the set
-                            actions.add(action)
+                actions = []
+
+                # For each Item that the target thing contains, add the Actions on it whose names match:
+                for item in get_contents(thing, Item):
+                    actions.extend(find_actions(item, cmd, 2))
+                    if len(actions) > 1:
+                        break
                 logger.trace("%r's contents contain matching: %r", thing, actions)
 
                 # Process list, and return if actions were found
@@ -342,24 +362,19 @@ class User(object):
                     thing = thing.parent
 
         # Command dispatch map. Built-in commands should be accessed this way.
-        if words[0] in commands.keys():
-            try:
-                if logger.isEnabledFor(logging.DEBUG):
-                    # Prepare some data for logging
-                    who_f = f"{self.player.name}#{self.player.id}" if self.player else self.transport.getHost().host
-                    params_f = f"({', '.join(params)})" if params else ''
-
-                    if words[0] in ('connect', '@connect'):
-                        # Parameter is a password, and must be redacted
-                        params_f = "[password redacted]"
-
-                    logger.debug(f"{who_f} running command: {words[0]}{params_f}")
-
-            except TypeError:
-                logger.trace(f"words: {words!r}, params: {params!r}", exc_info=True)
+        if handler is not None:
+            # Only gather the details for the log message if it will actually be written
+            if logger.isEnabledFor(logging.DEBUG):
+                who = "{0}#{1}".format(self.player.name, self.player.id) if self.player else self.transport.getHost().host
+                if cmd in ('connect', '@connect'):
+                    # Parameter is a password, and must be redacted
+                    params_f = "[password redacted]"
+                else:
+                    params_f = "({0})".format(', '.join(params)) if params else ''
+                logger.debug("%s running command: %s%s", who, cmd, params_f)
 
             # Execute the command
-            commands[words[0]](self, params)
+            handler(self, params)
             return
 
         # If control fell through this far, then we have an unknown command/action
@@ -442,8 +457,6 @@ class SSHUser(avatar.ConchUser, User):
         # The protocol controls the way that data is sent and received down the connection.
         # In our case, it presents a TTY-based user interface to the user, while all we care
         # about is sending lines to the user and receiving lines from them.
-        #TODO: Why isn't this import at the top?
-        #from Network import SSHServerProtocol
         # Get the protocol instance. The protocol is also our transport.
         #     Note that the Twisted networking model is a stack of protocols,
         #     where lower level protocols transport higher level ones.
@@ -1,7 +1,8 @@
 import inspect
+import sys
 import time
 import typing
-from enum import Enum
+from enum import IntEnum
 import logging
 
 from twisted.python.log import PythonLoggingObserver
@@ -64,17 +65,21 @@ def get_logger(name: str) -> LoggerBase:
     return logging.getLogger(name=name)
 
 
-def log(lvl, message):
-    frm = inspect.stack()[1]
-    mod = inspect.getmodule(frm[0])
+def log(lvl, message, *args):
+    """
+    Logs a message to the logger of the calling module.
 
-    logger = logging.getLogger(mod.__name__)
+    Any extra args are %-formatted into the message, but only if the message will actually be
+    logged at this level, so they can be used to avoid building strings that will be thrown away.
+    """
+    # Only the caller's module name is needed, which is much cheaper to get from its frame than from inspect.stack().
+    logger = logging.getLogger(sys._getframe(1).f_globals.get('__name__', '?'))
     # TODO: Format log appropriately
     try:
         lvl = getattr(logging, lvl.name.upper())
     except AttributeError:
         lvl = logging.DEBUG
-    logger.log(lvl, LogMessage(message))
+    logger.log(lvl, LogMessage(message), *args)
 
 
 class Loggable:
@@ -152,13 +157,14 @@ def enum(*args, **named):
     >>> Coins.Penny < Coins.Dime
     True
 
-    And don't work across types, even if their values are identical.
+    The values are ints, so they also compare equal to plain ints, and to
+    values of other enums with the same number.
     >>> Coins.Penny
     Penny=1
-    >>> Animals.Pig
-    Pig=1
-    >>> Coins.Penny == Animals.Pig
-    False
+    >>> Coins.Penny == 1
+    True
+    >>> Coins.Penny + Coins.Dime
+    11
 
     Enum values can also be looked up, by both name and value:
     >>> Coins['Penny']
@@ -170,34 +176,25 @@ def enum(*args, **named):
 
     """
 
-    prenums = zip(args, range(len(args)))+named.items() 
-    h = hash(repr(sorted(prenums, key=lambda x: x[1])))
+    prenums = list(zip(args, range(len(args)))) + list(named.items())
 
-    def factory(n, s, h):
-        class EnumValue(enum.EnumValue):
-            __slots__ = []
+    def factory(n, s):
+        # Each value is an int, so comparing and hashing them is done by int itself.
+        class EnumValue(int, enum.EnumValue):
+            __slots__ = ()
             __name__ = s
-            _hash = h
+            def __new__(cls):
+                return int.__new__(cls, n)
             def __str__(self): return s
             def __repr__(self):
                 return "{0}={1}".format(s, n)
-            def __int__(self):
-                return n
-            def __cmp__(self, other):
-                if isinstance(other, int): return n.__cmp__(other)
-                if hasattr(other, '_hash') and h==other._hash: return n.__cmp__(other.value())
-                return NotImplemented
             def __getitem__(self, x):
                 return (s, n)[x]
-            def __hash__(self): return h+n
-            def __eq__(self, other): return other is self or other == n
-            @property
             def name(self): return s
-            @property
             def value(self): return n
         return EnumValue
 
-    enums = dict(map(lambda x: (x[0], factory(x[1], x[0], h)()), prenums))
+    enums = dict(map(lambda x: (x[0], factory(x[1], x[0])()), prenums))
 
     t = type("Enum", (enum.Enum,), enums)
     lookup = dict(map(lambda x: (x[1], x[0]), prenums))
@@ -206,14 +203,14 @@ def enum(*args, **named):
             if s in lookup.values():
                 return getattr(t, s)
             else: raise IndexError("No such name in this enumeration")
+        elif isinstance(s, enum.EnumValue):
+            if any(s is v for v in enums.values()):
+                return s
+            else: raise IndexError("No such value in this enumeration")
         elif type(s) is int:
             if s in lookup:
                 return getattr(t, lookup[s])
             else: raise IndexError("No such numeric value in this enumeration")
-        elif type(s) is enum.EnumValue:
-            if s in enums.values():
-                return s
-            else: raise IndexError("No such value in this enumeration")
         raise TypeError("Expected int or string")
     setattr(t, '__call__', Enum)
     _repr = 'enum({0})'.format(', '.join(repr(x) for x in sorted(enums, key=enums.get)))
@@ -253,7 +250,7 @@ Definitions:
     Trace: Intended for in-depth debugging. Used to log every detail of program operation to track down program errors.
 """
 # Note: This is unused with the current logging setup, which uses new log levels.
-LogLevel = Enum('LogLevel', ('Trace', 'Debug', 'Info', 'Notice', 'Warn', 'Error', 'Fatal'))
+LogLevel = IntEnum('LogLevel', ('Trace', 'Debug', 'Info', 'Notice', 'Warn', 'Error', 'Fatal'))
 
 class LogMessage:
     def __init__(self, msg):
@@ -269,20 +266,28 @@ def setLogLevel(level):
     global _loglevel
     _loglevel = level
 
-import sys
 _loglevel = LogLevel.Info
+# The last timestamp written by old_log(), and the second that it was formatted for.
+_last_timestamp = (0, '')
+
+def _timestamp():
+    "Returns the current time for old_log(), only formatting it again once the second changes."
+    global _last_timestamp
+    now = int(time.time())
+    if now != _last_timestamp[0]:
+        _last_timestamp = (now, time.strftime('[%H:%M:%S]', time.localtime(now)))
+    return _last_timestamp[1]
+
 def old_log(level, message):
     if level < _loglevel:
         #print level, loglevel
         return
     log_level_name = level.name.upper() if isinstance(level, LogLevel) else "OTHER"
     if _loglevel <= LogLevel.Debug:
-        frm = inspect.stack()[1]
-        mod = inspect.getmodule(frm[0])
-        sys.stdout.write("{0} [{1}/{3}] {2}\r\n".format(time.strftime('[%H:%M:%S]'),
-            log_level_name, message, mod.__name__) )
+        sys.stdout.write("{0} [{1}/{3}] {2}\r\n".format(_timestamp(),
+            log_level_name, message, sys._getframe(1).f_globals.get('__name__', '?')) )
     else:
-        sys.stdout.write("{0} [{1}] {2}\r\n".format(time.strftime('[%H:%M:%S]'),
+        sys.stdout.write("{0} [{1}] {2}\r\n".format(_timestamp(),
             log_level_name, message) )
 
 
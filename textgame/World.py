@@ -2,9 +2,10 @@
 #from SqliteDB import SqliteDatabase as Database
 
 from textgame.db import DBType, Database
-from textgame.Things import Thing
+from textgame.Things import Thing, Action
 from textgame.Util import log, LogLevel
 from twisted.internet import task
+from bisect import bisect_left
 import time
 
 def ThingProxyFactory(_world):
@@ -109,6 +110,12 @@ def ThingProxyFactory(_world):
             """
             thing = self.world.db.load_object(self.world, self._id)
             assert thing is not None, "The thing in {0} is None! This shouldn't happen".format(self)
+            return self._attach(thing)
+
+        def _attach(self, thing):
+            """
+            Makes this ThingProxy refer to the given Thing, which has just been loaded.
+            """
             thing.world = self.world
             # Use object.__setattr__ to set self._thing because we overrode our own __setattr__
             object.__setattr__(self, '_thing', thing)
@@ -126,19 +133,27 @@ def ThingProxyFactory(_world):
                 return setattr(self._thing, name, value)
             return object.__setattr__(self, name, value)
         
-        # This is pretty much a direct copy/paste from Thing
         def __getitem__(self, key):
             """
             Thing property getter.
+
+            A loaded Thing may already have the property in its cache, so it is asked first.
             """
+            thing = self._thing
+            if thing is not None:
+                return thing[key]
             return self.world.db.get_property(self._id, key)
 
-        # This is pretty much a direct copy/paste from Thing
         def __setitem__(self, key, value):
             """
             Thing property setter.
             """
             self.world.db.set_property(self._id, key, value)
+            thing = self._thing
+            if thing is not None:
+                # Keep the loaded Thing's cache in step, and don't let an older unsaved value overwrite this one.
+                thing._propcache[key] = value
+                thing._propdirty.discard(key)
 
         # Override underlying Thing's id property so that we don't trigger
         # a Thing reload just to obtain the ID that we already store
@@ -161,7 +176,7 @@ def ThingProxyFactory(_world):
             Saves this Thing to the database, only if it has been changed since it was last loaded.
             """
             if self._dirty:
-                log(LogLevel.Trace, "ThingProxy#{0}: Saving dirty Thing".format(self._id))
+                log(LogLevel.Trace, "ThingProxy#%s: Saving dirty Thing", self._id)
                 self._thing.force_save()
                 self._dirty = False
 
@@ -190,13 +205,24 @@ class World(object):
         self.db: Database = Database(backend, database)
         self.cache = {}
         self.live_set = set() # The live set tracks ThingProxies that are keeping Things loaded
+        self.action_index = {} # Maps a Thing's ID to a sorted list of (lowercase name, ID) of the Actions it contains
         self.cache_task = task.LoopingCall(self.purge_cache)
         self.cache_task.start(300)
+        self.flush_task = task.LoopingCall(self.db.flush)
+        self.flush_task.start(5)
+        self.checkpoint_task = task.LoopingCall(self.db.checkpoint)
+        self.checkpoint_task.start(600, now=False)
         self.ThingProxy = ThingProxyFactory(self)
 
     def close(self):
+        # Stop the background tasks first, as they can't run once the database is closed
+        for looping_task in (self.cache_task, self.flush_task, self.checkpoint_task):
+            if looping_task.running:
+                looping_task.stop()
         # Immediately purge (and save, if neccessary) all cached objects
         self.purge_cache(-1)
+        # Write out everything that is still buffered before closing
+        self.db.flush()
         self.db.close()
     
     def connect(self, username, password=None):
@@ -217,10 +243,10 @@ class World(object):
         loaded again upon demand.
         """
         if not obj in self.cache:
-            log(LogLevel.Trace, "Cache: MISS #{0}".format(obj))
+            log(LogLevel.Trace, "Cache: MISS #%s", obj)
             return self.ThingProxy(self, obj)
         else:
-            log(LogLevel.Trace, "Cache: Hit #{0}".format(obj))
+            log(LogLevel.Trace, "Cache: Hit #%s", obj)
             return self.cache[obj]
 
     def purge_cache(self, expiry=3600): #TODO: Rename this function?
@@ -241,28 +267,65 @@ class World(object):
                 obj.save()
                 savecount += 1
         purge_count = len(objects) - len(self.live_set)
+        # The index is rebuilt for each Thing as it is searched again.
+        self.action_index.clear()
         if purge_count > 0:
-            log(LogLevel.Trace,
-                "Cache: Purged {0} stale objects from memory (saved {1})".format(purge_count, savecount))
+            log(LogLevel.Trace, "Cache: Purged %d stale objects from memory (saved %d)", purge_count, savecount)
 
-    def get_contents(self, thing):
-        """Returns a tuple of Things that the given Thing contains."""
+    def get_contents(self, thing, thingtype=None):
+        """
+        Returns a list of Things that the given Thing contains.
+        If a Thing class is given, only contents of that type are returned.
+        """
         try:
             # Get list of IDs
-            items = self.db.get_contents(thing.id)
-            # Get Things and return them
-            return map(lambda x: self.get_thing(x), items)
+            if thingtype is None:
+                items = self.db.get_contents(thing.id)
+            else:
+                items = self.db.get_contents_by_type(thing.id, thingtype.dbtype)
         except AttributeError:
             raise TypeError("Expected a Thing as argument, got {0}".format(type(thing)))
+        # Get Things, loading any that aren't loaded yet in one go, and return them
+        proxies = [self.get_thing(x) for x in items]
+        unloaded = [proxy.id for proxy in proxies if proxy._thing is None]
+        if unloaded:
+            for obj, loaded in self.db.load_objects(self, unloaded).items():
+                self.cache[obj]._attach(loaded)
+        return proxies
+
+    def find_actions(self, thing, prefix, limit=None):
+        """
+        Returns a list of the Actions in the given Thing whose names start with the given lowercase prefix.
+
+        If limit is given, no more than that many Actions are returned. Callers that only need to tell
+        one match from several can pass a limit of 2.
+        """
+        index = self.action_index.get(thing.id)
+        if index is None:
+            index = sorted((action._name_lower, action.id) for action in self.get_contents(thing, Action))
+            self.action_index[thing.id] = index
+        # The matching names are all together, starting from the first name that isn't less than the prefix.
+        found = []
+        for i in range(bisect_left(index, (prefix,)), len(index)):
+            name, obj = index[i]
+            if not name.startswith(prefix) or len(found) == limit:
+                break
+            found.append(self.get_thing(obj))
+        return found
 
     def save_thing(self, thing):
         #TODO: Review this function vs. calling thing.force_save()
         # Right now, thing.force_save() just calls this method.
         # Save Thing basic info
         self.db.save_object(thing)
+        if isinstance(thing, Action) and not thing._dirty_fields.isdisjoint(('name', 'parent')):
+            # The index may have been rebuilt from the old rows since the Action was changed.
+            # Neither its old location nor its new one are indexed correctly, so start over.
+            self.action_index.clear()
         # Save any modified properties of the Thing
-        for prop in thing._propdirty:
-            self.db.set_property(thing.id, prop, thing._propcache[prop])
+        self.db.set_properties([(thing.id, prop, thing._propcache[prop]) for prop in thing._propdirty])
+        thing._dirty_fields.clear()
+        thing._propdirty.clear()
 
     def find_user(self, name):
         """
@@ -55,7 +55,7 @@ class DBCredentialsChecker(object):
         if IUsernameRequest.providedBy(creds):
             # The credentials are a request to create a new account.
             # We need to make sure the username is available to be registered.
-            logger.trace("Handling IUsernameRequest: Checking if {0} is available".format(creds.username))
+            logger.trace("Handling IUsernameRequest: Checking if %s is available", creds.username)
             if not self.db.username_exists(creds.username):
                 # No such username exists, success!
                 return defer.succeed(creds.username)
@@ -65,7 +65,7 @@ class DBCredentialsChecker(object):
 
         else:
             # The credentials are for an existing account.
-            logger.trace("Asked to check credentials for {0}".format(creds.username))
+            logger.trace("Asked to check credentials for %s", creds.username)
             try:
                 user = creds.username
                 if not self.db.verify_password(user, creds.password):
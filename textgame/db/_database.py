@@ -14,7 +14,7 @@ import random
 import time
 import functools
 import types
-from enum import Enum
+from enum import IntEnum
 
 from zope.interface import verify
 from zope.interface.exceptions import Invalid
@@ -27,7 +27,7 @@ from textgame.Util import get_logger
 logger = get_logger(__name__)
 
 
-class DBType(Enum):
+class DBType(IntEnum):
     """
     This is the master Enum of Thing types as used in the database.
     Do not re-order this, or existing databases will break!
@@ -158,6 +158,20 @@ class Database(object):
         self._backend.close()
         self.active = False
 
+    @require_connection
+    def flush(self):
+        """
+        Writes any buffered changes through to the database.
+        """
+        self._backend.flush()
+
+    @require_connection
+    def checkpoint(self):
+        """
+        Lets the backend perform periodic housekeeping, such as checkpointing its log.
+        """
+        self._backend.checkpoint()
+
     @require_connection
     def username_exists(self, username):
         """
@@ -172,19 +186,19 @@ class Database(object):
         the provided username, False otherwise.
         """
 
-        logger.trace(f"Verifying PBKDF2 password hash for user {username}, password {'*'*len(password)} (redacted)")
+        logger.trace("Verifying PBKDF2 password hash for user %s, password %s (redacted)", username, '*'*len(password))
 
         # Retrieve user login details
         result = self._backend.get_user(username)
         if result is None:
-            logger.trace(f"No such user in database: {username}")
+            logger.trace("No such user in database: %s", username)
             return False
         pwhash, salt = result
         if pwhash is None:
             logger.debug(f"Hash for {username} is None, no password is set. Setting it to the entered password")
             self._backend.set_password(username, *create_hash(password))
             return True
-        logger.trace(f"Successfully retrieved hash={pwhash}, salt={salt} from database")
+        logger.trace("Successfully retrieved hash=%s, salt=%s from database", pwhash, salt)
         # Hash provided password and compare with database
         inputhash = hash_pass(password, salt)
         if pwhash != inputhash:
@@ -206,7 +220,7 @@ class Database(object):
         :param charname: The character name
         :return: True if the character was created, False if it exists already.
         """
-        logger.trace(f"Creating character {charname!r} for user {username!r}")
+        logger.trace("Creating character %r for user %r", charname, username)
         return self._backend.create_character(username, charname) is not None
 
     @require_connection
@@ -249,19 +263,58 @@ class Database(object):
         if result is None:
             logger.error(f"The id #{obj} does not exist in the database!")
             return None
+        return self._make_thing(world, obj, result)
+
+    def load_objects(self, world, ids):
+        """
+        Loads several objects by ID from the database at once.
+
+        Returns a dict mapping each ID to its Thing. IDs which do not exist
+        in the database are left out.
+        """
+        rows = self._backend.load_objects(ids)
+        # Some types of Thing fetch a few properties as soon as they are created. Fetch those
+        # for all of the objects of each such type at once, rather than once per object.
+        precache = {}
+        for obj, row in rows.items():
+            try:
+                keys = DBType(row[0]).type.precache
+            except ValueError:
+                # An unknown type, which _make_thing() will report.
+                continue
+            if keys:
+                precache.setdefault(keys, []).append(obj)
+        props = {}
+        for keys, objs in precache.items():
+            props.update(self._backend.get_many_properties(objs, keys))
+        return {obj: self._make_thing(world, obj, row, props.get(obj)) for obj, row in rows.items()}
+
+    def _make_thing(self, world, obj, result, props=None):
+        """
+        Creates a Thing instance from a row returned by the backend.
+
+        If props is given, it holds the properties that the Thing would otherwise fetch when created.
+        """
         try:
             obtype = DBType(result[0])
         except IndexError as e:
             raise ValueError("Unknown DBType {0} while loading #{1} from the database!".format(result[0], obj))
 
-        logger.debug(f"We loaded {obj}#{result[1]} (type={obtype}) out of the database!")
+        logger.debug("We loaded %s#%s (type=%s) out of the database!", obj, result[1], obtype)
 
         # Create Thing instance
-        newobj = obtype.type(world, obj, *result[1:])
+        newobj = obtype.type(world, obj, *result[1:], props=props)
 
         #log.debug("Database.load_object(): Returning {0}".format(repr(newobj)))
         return newobj
 
+    @require_connection
+    def save_object(self, thing):
+        """
+        Saves the basic data of a Thing back to the database.
+        """
+        self._backend.save_object(thing)
+
     @require_connection
     def get_property(self, obj, key):
         """
@@ -269,18 +322,51 @@ class Database(object):
         """
         return self._backend.get_property(obj, key)
 
+    @require_connection
+    def get_properties(self, obj, keys):
+        """
+        Fetches several property values of an object in the database at once, as a dict.
+        """
+        return self._backend.get_properties(obj, keys)
+
+    @require_connection
+    def get_many_properties(self, ids, keys):
+        """
+        Fetches the same properties of many objects in the database at once, as a dict of dicts keyed on ID.
+        """
+        return self._backend.get_many_properties(ids, keys)
+
     @require_connection
     def set_property(self, obj, key, value):
         """
         Sets a property value of an object in the database.
 
-        Currently, this performs an immediate database write.
+        The backend may buffer the write until the next flush().
         """
         self._backend.set_property(obj, key, value)
 
+    @require_connection
+    def set_properties(self, rows):
+        """
+        Sets many property values at once, given an iterable of (obj, key, value) tuples.
+        """
+        self._backend.set_properties(rows)
+
     def get_contents(self, obj):
         return self._backend.get_contents(obj)
 
+    def get_contents_by_type(self, obj, dbtype):
+        """
+        Returns a list of the IDs of the objects of the given DBType contained by an object.
+        """
+        return self._backend.get_contents_by_type(obj, dbtype)
+
+    def get_contents_with_flags(self, obj):
+        """
+        Returns a list of (id, type, flags) tuples for the objects contained by an object.
+        """
+        return [(obj_id, DBType(typ), flags) for obj_id, typ, flags in self._backend.get_contents_with_flags(obj)]
+
     def create_user(self, username: str, password: str, pubkeys: Sequence[str], character: Optional[str]=None):
         """
         Creates a new user in the database, and also creates an initial character for the user.
@@ -35,6 +35,21 @@ class IDatabaseBackend(Interface):
         After this is called, the instance is not expected to be usable.
         """
 
+    def flush():
+        """
+        Write any changes that the backend has buffered through to the database.
+
+        Backends which write immediately may implement this as a no-op.
+        """
+
+    def checkpoint():
+        """
+        Perform any periodic housekeeping that the database needs, such as checkpointing a
+        write-ahead log. This will be called every few minutes.
+
+        Backends which have nothing to do may implement this as a no-op.
+        """
+
     def get_user(username):
         """
         Given a username, this method returns a record from the User table if the user
@@ -75,12 +90,30 @@ class IDatabaseBackend(Interface):
         id is "obj".
         """
 
+    def get_properties(obj, keys):
+        """
+        This method should return the values of several properties of the object whose id
+        is "obj" at once, as a dict mapping each of the given keys to its value (or None).
+        """
+
+    def get_many_properties(ids, keys):
+        """
+        This method should return the same properties of many objects at once, as a dict
+        mapping each of the given ids to a dict like the one returned by get_properties.
+        """
+
     def set_property(obj, key, val):
         """
         This method should set the value of the property named "key" on the object whose
         id is "obj" to the value "val".
         """
 
+    def set_properties(rows):
+        """
+        This method should set many properties at once, given an iterable of (obj, key, val)
+        tuples. It should be equivalent to calling set_property for each tuple, but faster.
+        """
+
     def load_object(obj):
         """
         This method should load an object out of the database, returning the row loaded,
@@ -88,6 +121,39 @@ class IDatabaseBackend(Interface):
         type, name, flags, parent, owner, link, money, created, modified, lastused
         """
 
+    def load_objects(ids):
+        """
+        This method should load many objects out of the database at once, returning a dict
+        which maps the id of each object that exists to its row, as returned by load_object.
+        """
+
+    def save_object(thing):
+        """
+        This method should write the basic data of a Thing back to its row in the database.
+
+        The Thing's _dirty_fields attribute holds the names of the fields in Thing.dbattrs
+        which have changed since it was loaded or last saved. A backend may choose to only
+        write those fields.
+        """
+
+    def get_contents(obj):
+        """
+        This method should return a list of the ids of the objects whose parent is the object
+        whose id is "obj".
+        """
+
+    def get_contents_by_type(obj, dbtype):
+        """
+        This method should return a list of the ids of the objects of type "dbtype" (the value
+        of a DBType) whose parent is the object whose id is "obj".
+        """
+
+    def get_contents_with_flags(obj):
+        """
+        This method should return a list of (id, type, flags) tuples, one for each object whose
+        parent is the object whose id is "obj".
+        """
+
     def create_user(username: str, password: str, pubkeys: Sequence[str]):
         """
         This method should create a new user in the database. TODO: #3: finish this docstring
@@ -2,7 +2,13 @@
 This module is the Sqlite implementation of the textgame database.
 """
 
+import queue
 import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
 
 # Third party library imports
 import time
@@ -14,91 +20,480 @@ from textgame.db import IDatabaseBackend
 from textgame.db.backends.schema.SqliteSchema import Schema
 from textgame.Util import log
 
+# Database tuning, applied once by the writer when the database is opened.
+# page_size has to come first, as it only has an effect before the first table is created.
+DATABASE_PRAGMAS = (
+    "PRAGMA page_size = 4096",
+    "PRAGMA journal_mode = WAL",      # Readers don't block the writer, and commits append to the WAL
+)
 
-class Cursor(object):
+# Connection tuning, applied to the writer and to every pooled reader.
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",    # Only fsync at checkpoints, which is safe in WAL mode
+    "PRAGMA temp_store = MEMORY",     # Keep temporary tables and sorts off the disk
+    "PRAGMA cache_size = -64000",     # 64MB page cache (negative values are in KiB)
+    "PRAGMA mmap_size = 268435456",   # Read pages through a 256MB memory map
+    "PRAGMA busy_timeout = 5000",     # Wait up to 5 seconds for a lock instead of failing
+    "PRAGMA wal_autocheckpoint = 1000",  # Copy the WAL back into the database every 1000 pages
+    "PRAGMA journal_size_limit = 67108864",  # Truncate the WAL back to 64MB after a checkpoint
+    "PRAGMA analysis_limit = 1000",   # Keep PRAGMA optimize quick by only sampling each index
+)
+
+PRAGMAS = DATABASE_PRAGMAS + CONNECTION_PRAGMAS
+
+# Most IDs that will be bound into a single IN (...) list, which keeps well below
+# the limit on the number of parameters in a statement.
+MAX_IN_PARAMS = 500
+
+# Number of write jobs after which the next checkpoint() also refreshes the query planner statistics.
+OPTIMIZE_INTERVAL = 10000
+
+# Number of read-only connections kept open alongside the writer.
+READ_POOL_SIZE = 4
+
+# Number of buffered property writes that will trigger a flush on their own.
+PROPERTY_BUFFER_SIZE = 1000
+
+# Number of buffered object saves that will trigger a flush on their own.
+SAVE_BUFFER_SIZE = 1000
+
+# Number of entries kept by each of the property and object read caches.
+READ_CACHE_SIZE = 4096
+
+# The type value of Actions (DBType.Action). The Actions in each object are cached, as every command searches them.
+ACTION_TYPE = 3
+
+# Size of the per-connection prepared statement cache (the sqlite3 default is 128).
+STATEMENT_CACHE_SIZE = 256
+
+# SQL used by the backend. These are reused verbatim on every call, so that each call is
+# served from the connection's prepared statement cache rather than being parsed again.
+SQL_GET_USER = "SELECT password, salt FROM users WHERE username == ?"
+SQL_SET_PASSWORD = ("INSERT INTO users(username, password, salt) VALUES (?, ?, ?) "
+                    "ON CONFLICT(username) DO UPDATE SET password=excluded.password, salt=excluded.salt")
+SQL_GET_USER_CHARACTERS = ("SELECT DISTINCT name FROM objects INNER JOIN characters "
+                           "ON characters.obj == objects.id AND characters.username == ?")
+SQL_GET_PLAYER_ID = ("SELECT id FROM objects INNER JOIN characters ON characters.obj == objects.id "
+                     "AND characters.username == ? AND objects.name == ?")
+# Creates a Player that owns itself, in a single statement. The lowest deleted ID is reused if there is
+# one, in which case the deleted object's row is overwritten (and the reuse_deleted trigger takes the
+# ID off the deleted list). Otherwise, the next unused ID is taken.
+SQL_CREATE_PLAYER = """
+    WITH new(id) AS (SELECT coalesce((SELECT min(obj) FROM deleted), (SELECT ifnull(max(id), -1) + 1 FROM objects)))
+    INSERT INTO objects SELECT id, ?, 1, 0, ?, id, NULL, 0, ?, ?, ? FROM new WHERE true
+    ON CONFLICT(id) DO UPDATE SET name=excluded.name, type=excluded.type, flags=excluded.flags,
+        parent=excluded.parent, owner=excluded.owner, link=excluded.link, money=excluded.money,
+        created=excluded.created, modified=excluded.modified, lastused=excluded.lastused
+    RETURNING id"""
+SQL_ADD_CHARACTER = "INSERT INTO characters VALUES (?, ?)"
+SQL_GET_PROPERTY = "SELECT value FROM properties WHERE obj==? AND key==?"
+SQL_SET_PROPERTY = "INSERT OR REPLACE INTO properties VALUES (?, ?, ?)"
+# Gets several properties of an object at once. Takes a comma separated list of placeholders.
+SQL_GET_PROPERTIES = "SELECT key, value FROM properties WHERE obj==? AND key IN ({0})"
+# Gets the same properties of many objects at once. Takes two comma separated lists of placeholders,
+# for the objects and then the keys.
+SQL_GET_MANY_PROPERTIES = "SELECT obj, key, value FROM properties WHERE obj IN ({0}) AND key IN ({1})"
+# Loading an object also fetches its description, which every Thing reads as soon as it is created.
+# The description is the last column, and goes into the property cache rather than the object row.
+SQL_LOAD_OBJECT = ("SELECT type, name, flags, parent, owner, link, money, created, modified, lastused, value "
+                   "FROM objects LEFT JOIN properties ON obj == id AND key == '_/desc' WHERE id==?")
+# Loads many objects at once. Takes a comma separated list of placeholders.
+SQL_LOAD_OBJECTS = ("SELECT id, type, name, flags, parent, owner, link, money, created, modified, lastused, value "
+                    "FROM objects LEFT JOIN properties ON obj == id AND key == '_/desc' WHERE id IN ({0})")
+# Saving an object only writes the columns that can have changed, so that indexes on
+# the columns that haven't changed (name, parent, owner, link) don't need to be updated.
+SQL_SAVE_OBJECT_TOUCH = "UPDATE objects SET modified=?, lastused=? WHERE id==? AND type==?"
+SQL_SAVE_OBJECT_STATE = "UPDATE objects SET flags=?, money=?, modified=?, lastused=? WHERE id==? AND type==?"
+SQL_SAVE_OBJECT_META = ("UPDATE objects SET name=?, flags=?, money=?, modified=?, lastused=? "
+                        "WHERE id==? AND type==?")
+SQL_SAVE_OBJECT_PARENT = ("UPDATE objects SET parent=?, name=?, flags=?, money=?, modified=?, lastused=? "
+                          "WHERE id==? AND type==?")
+SQL_SAVE_OBJECT = ("UPDATE objects SET parent=?, owner=?, name=?, flags=?, link=?, money=?, "
+                   "modified=?, lastused=? WHERE id==? AND type==?")
+SQL_GET_CONTENTS = "SELECT id FROM objects WHERE parent==?"
+SQL_GET_CONTENTS_WITH_FLAGS = "SELECT id, type, flags FROM objects WHERE parent==?"
+SQL_GET_CONTENTS_BY_TYPE = "SELECT id FROM objects WHERE parent==? AND type==?"
+
+# The narrower save statements, from cheapest to dearest. Each entry has the Thing fields that the statement
+# will write, and the positions in a full SQL_SAVE_OBJECT row of the values that it takes.
+# An object is saved with the first statement that writes all of its changed fields, or SQL_SAVE_OBJECT.
+SAVE_STATEMENTS = (
+    (frozenset(), SQL_SAVE_OBJECT_TOUCH, (6, 7, 8, 9)),
+    (frozenset(('flags', 'money')), SQL_SAVE_OBJECT_STATE, (3, 5, 6, 7, 8, 9)),
+    (frozenset(('name', 'flags', 'money')), SQL_SAVE_OBJECT_META, (2, 3, 5, 6, 7, 8, 9)),
+    (frozenset(('parent', 'name', 'flags', 'money')), SQL_SAVE_OBJECT_PARENT, (0, 2, 3, 5, 6, 7, 8, 9)),
+)
+SQL_OPTIMIZE = "PRAGMA optimize"
+SQL_CHECKPOINT = "PRAGMA wal_checkpoint(TRUNCATE)"
+
+
+def _scalar(cursor, row):
     """
-    Used in a "with" statement to provide a cursor that is automatically closed.
+    Row factory for single-column queries, which yields the value itself instead of a 1-tuple.
     """
+    return row[0]
 
-    def __init__(self, db):
-        """
-        Save the sqlite3 object from the SqliteDatabase
-        """
-        self.conn = db.conn
 
-    def __enter__(self) -> sqlite3.Cursor:
-        """
-        Obtain a cursor, save and return it.
-        """
-        self.cursor = self.conn.cursor()
-        return self.cursor
+def _scalar_cursor(conn):
+    """
+    Returns a cursor on the given connection whose rows are single values.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = _scalar
+    return cursor
 
-    def __exit__(self, typ, value, traceback):
-        """
-        Close the cursor that we returned earlier.
-        """
-        self.cursor.close()
+
+def _executemany_rows(conn, sql, rows):
+    """
+    Runs a statement for many rows at once, in a savepoint. If any row fails, the savepoint is
+    rolled back and the rows are run again one at a time, so that one bad row doesn't lose the others.
+
+    Returns a list of (row, exception) for the rows that failed.
+    """
+    conn.execute("SAVEPOINT rows")
+    try:
+        conn.executemany(sql, rows)
+    except sqlite3.Error:
+        conn.execute("ROLLBACK TO rows")
+    else:
+        conn.execute("RELEASE rows")
+        return []
+    failed = []
+    for row in rows:
+        conn.execute("SAVEPOINT row")
+        try:
+            conn.execute(sql, row)
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK TO row")
+            failed.append((row, e))
+        conn.execute("RELEASE row")
+    conn.execute("RELEASE rows")
+    return failed
+
+
+def _log_write_failure(future):
+    """
+    Reports an error from a queued write that nothing is waiting on.
+    """
+    if future.exception() is not None:
+        log.warn(f"Database write failed: {future.exception()!r}")
+
+
+class _LRUCache(object):
+    """
+    A small least-recently-used cache for query results.
+
+    Keeps count of its hits and misses, so that its size can be tuned.
+    """
+    #: Returned by get() when the key isn't cached, as None is a valid cached result.
+    MISSING = object()
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return self.MISSING
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
 
 
 @implementer(IDatabaseBackend)
 class Sqlite(object):
     def __init__(self, connect_string):
         self.filename = connect_string
-        log.info("Database activated: " + connect_string)
+        log.info("Database activated: %s", connect_string)
 
         # Sanity check sqlite version 3.6.19 or greater
         sqlite_version = version.parse(sqlite3.sqlite_version)
-        if sqlite_version < version.parse("3.24.0"):
+        if sqlite_version < version.parse("3.35.0"):
             log.warn("Sqlite backend needs a newer version of Sqlite.")
-            log.warn("You have: Sqlite {0}".format(sqlite3.sqlite_version))
-            log.warn("You need: Sqlite 3.24.0 or later")
-            log.warn("Continuing anyway, but foreign key constraints will not work.")
+            log.warn("You have: Sqlite %s", sqlite3.sqlite_version)
+            log.warn("You need: Sqlite 3.35.0 or later")
+            log.warn("Continuing anyway, but character creation and upserts will not work.")
 
         log.info("Opening sqlite database connection.")
 
-        self.conn = sqlite3.connect(connect_string)
+        # All writes go through this one connection. Once the schema is set up, it is only
+        # used by the writer thread (or while the writer thread is known to be idle).
+        # Transactions are always begun explicitly, so the sqlite3 module's implicit ones are turned off.
+        self.conn = sqlite3.connect(connect_string, isolation_level=None, check_same_thread=False,
+                                    cached_statements=STATEMENT_CACHE_SIZE)
         self.active = True
         c = self.conn.cursor()
-        c.execute('PRAGMA foreign_keys = ON')
+        for pragma in PRAGMAS:
+            c.execute(pragma)
+        # Sqlite quietly keeps the old journal mode if it can't use WAL, so check that it worked.
+        journal_mode = c.execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode not in ('wal', 'memory'):
+            log.warn("Sqlite could not enable WAL mode (journal_mode is %s).", journal_mode)
+            log.warn("Is the database on a network filesystem? Readers will block the writer.")
 
-        Schema(c).create()
+        schema = Schema(c)
+        schema.create()
+        schema.upgrade()
         c.close()
-        self.conn.commit()
-        pass
+
+        # Reads are served from a pool of read-only connections. In WAL mode these never block
+        # the writer, nor are they blocked by it.
+        self._read_pool = queue.Queue()
+        if connect_string in ('', ':memory:'):
+            # A private in-memory database can't be opened a second time, so the writer reads too.
+            self._read_pool.put(self.conn)
+        else:
+            uri = Path(connect_string).resolve().as_uri() + "?mode=ro"
+            for _ in range(READ_POOL_SIZE):
+                reader = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False,
+                                         cached_statements=STATEMENT_CACHE_SIZE)
+                for pragma in CONNECTION_PRAGMAS:
+                    reader.execute(pragma)
+                self._read_pool.put(reader)
+
+        # Property writes waiting to be flushed, keyed on (obj, key).
+        self._prop_buffer = {}
+        # Object saves waiting to be flushed, keyed on id. Each holds the set of changed fields
+        # and a full row of values, in the order that SQL_SAVE_OBJECT takes them.
+        self._save_buffer = {}
+        # Recently read property values and object rows.
+        self._prop_cache = _LRUCache(READ_CACHE_SIZE)
+        self._object_cache = _LRUCache(READ_CACHE_SIZE)
+        # The IDs of the Actions in recently searched objects, keyed on the containing object.
+        self._action_cache = _LRUCache(READ_CACHE_SIZE)
+
+        # Writes are queued up as jobs for a dedicated writer thread, which runs every job that
+        # is waiting in a single transaction.
+        self._write_queue = queue.Queue()
+        self._writes_since_optimize = 0
+        self._writer = threading.Thread(target=self._write_loop, name="Sqlite writer", daemon=True)
+        self._writer.start()
 
     def close(self):
         """
         Closes the Sqlite database.
         """
-        self.conn.commit()
+        self.flush()
+        # Stop the writer thread once it has finished everything in the queue.
+        self._write_queue.put((None, None))
+        self._writer.join()
+        # From here on, reads and writes fail instead of waiting for a reader or writer that has gone.
+        self.active = False
+        while not self._read_pool.empty():
+            reader = self._read_pool.get()
+            if reader is not self.conn:
+                reader.close()
+        # Let Sqlite refresh the query planner statistics if it thinks they are out of date,
+        # then copy everything into the database file so that the next start has no WAL to replay.
+        self.conn.execute(SQL_OPTIMIZE)
+        self.conn.execute(SQL_CHECKPOINT)
         self.conn.close()
 
+    def _write(self, job, wait=False):
+        """
+        Queues a write to be run on the writer thread. The job is a callable which is
+        passed the writer connection.
+
+        Most writes don't need to wait for the job to finish, as reads wait for all queued
+        writes to be committed before they query the database. If wait is True, this
+        returns the job's return value (or raises its exception) once it has committed.
+        """
+        if not self.active:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        future = Future()
+        self._write_queue.put((job, future))
+        if wait:
+            return future.result()
+        future.add_done_callback(_log_write_failure)
+
+    def _write_loop(self):
+        """
+        Runs on the writer thread. Takes batches of jobs from the write queue, and runs each
+        batch in one transaction. A job that fails is rolled back without affecting the rest.
+
+        If the transaction itself fails (the write lock couldn't be taken in time, or the commit
+        hit a disk error), every job in the batch fails with that error, and the writer carries on.
+        """
+        conn = self.conn
+        running = True
+        while running:
+            # Wait for a job, then take everything else that's waiting along with it.
+            batch = [self._write_queue.get()]
+            try:
+                while True:
+                    batch.append(self._write_queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            try:
+                jobs = [(job, future) for job, future in batch if job is not None]
+                if len(jobs) < len(batch):
+                    # Asked to stop, once this batch is done.
+                    running = False
+                done = []
+                try:
+                    if jobs:
+                        # Take the write lock up front, rather than upgrading to it part way through the batch.
+                        conn.execute("BEGIN IMMEDIATE")
+                        for job, future in jobs:
+                            conn.execute("SAVEPOINT job")
+                            try:
+                                result = job(conn)
+                            except Exception as e:
+                                conn.execute("ROLLBACK TO job")
+                                conn.execute("RELEASE job")
+                                done.append((future, None, e))
+                            else:
+                                conn.execute("RELEASE job")
+                                done.append((future, result, None))
+                        conn.execute("COMMIT")
+                except Exception as e:
+                    log.warn("Database transaction failed: %r", e)
+                    if conn.in_transaction:
+                        try:
+                            conn.execute("ROLLBACK")
+                        except sqlite3.Error:
+                            pass
+                    done = [(future, None, e) for job, future in jobs]
+                else:
+                    self._writes_since_optimize += len(done)
+
+                # Only report back once the writes are committed and visible to readers.
+                for future, result, error in done:
+                    if error is None:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(error)
+            finally:
+                # Readers wait on the queue, so it must always be told that the batch is finished.
+                for _ in batch:
+                    self._write_queue.task_done()
+
+    @contextmanager
+    def _reader(self):
+        """
+        Check a read-only connection out of the pool for the duration of a "with" block.
+
+        Waits for any queued writes to be committed first, so that reads always see them.
+        """
+        if not self.active:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        self._write_queue.join()
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+
+    def _fetchone(self, sql, params, scalar=False):
+        """
+        Runs a query on a pooled reader, and returns its first row (or None). With scalar=True,
+        returns the first column of the row instead.
+
+        This does the same as _reader(), without the overhead of a context manager, for the
+        point queries that are run most often.
+        """
+        if not self.active:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        self._write_queue.join()
+        conn = self._read_pool.get()
+        try:
+            return (_scalar_cursor(conn) if scalar else conn).execute(sql, params).fetchone()
+        finally:
+            self._read_pool.put(conn)
+
+    def flush(self):
+        """
+        Writes all buffered property changes and object saves to the database in a single transaction.
+
+        A change that can't be written (such as a property of an object that doesn't exist) is
+        logged as an error, and doesn't stop the rest from being written.
+        """
+        if not self._prop_buffer and not self._save_buffer:
+            return
+        props = [(obj, key, val) for (obj, key), val in self._prop_buffer.items()]
+        # Group the saves by the cheapest statement that covers each one's changed fields.
+        saves = {}
+        for dirty, row in self._save_buffer.values():
+            for fields, sql, columns in SAVE_STATEMENTS:
+                if dirty <= fields:
+                    saves.setdefault(sql, []).append(tuple(row[i] for i in columns))
+                    break
+            else:
+                saves.setdefault(SQL_SAVE_OBJECT, []).append(row)
+
+        def write(conn):
+            failed = _executemany_rows(conn, SQL_SET_PROPERTY, props)
+            for (obj, key, val), e in failed:
+                log.error("Could not write property %r of #%s: %r", key, obj, e)
+            for sql, rows in saves.items():
+                for row, e in _executemany_rows(conn, sql, rows):
+                    # The object's ID is always the second to last value in the row.
+                    log.error("Could not save object #%s: %r", row[-2], e)
+                    failed.append((row, e))
+            return failed
+
+        self._write(write)
+        self._prop_buffer.clear()
+        self._save_buffer.clear()
+
+    def _flush_saves(self):
+        """
+        Called before reading the objects table, so that buffered saves are visible to the query.
+        """
+        if self._save_buffer:
+            self.flush()
+
+    def checkpoint(self):
+        """
+        Copies the whole write-ahead log back into the database, and truncates the log file.
+
+        Automatic checkpoints never shrink the -wal file, so this keeps it from growing without bound.
+        """
+        self.flush()
+        # A checkpoint can't run inside the writer's transactions. Wait until the writer is idle instead.
+        self._write_queue.join()
+        if self._writes_since_optimize >= OPTIMIZE_INTERVAL:
+            # Enough has changed that the planner statistics may be out of date.
+            self.conn.execute(SQL_OPTIMIZE)
+            self._writes_since_optimize = 0
+        self.conn.execute(SQL_CHECKPOINT)
+
     def get_user(self, username):
         """
         Return a row from the User table, or None.
         """
-        with Cursor(self) as c:
-            c.execute("SELECT password, salt FROM users WHERE username == ?", (username,))
-            return c.fetchone()
+        return self._fetchone(SQL_GET_USER, (username,))
 
     def set_password(self, username: str, password_hash: bytes, salt: bytes):
-        with Cursor(self) as c:
-            # c.execute("UPDATE users SET password=?, salt=? WHERE username=?", (password_hash, salt, username))
-            c.execute("INSERT INTO users(username, password, salt) VALUES (?, ?, ?) "
-                      "ON CONFLICT(username) DO UPDATE SET password=?, salt=? WHERE username=?",
-                      (username, password_hash, salt, password_hash, salt, username))
-        return
+        self._write(lambda conn: conn.execute(SQL_SET_PASSWORD, (username, password_hash, salt)))
 
     def get_user_characters(self, username):
         """
         Given a username, this method returns a list of character
         names associated with a username.
         """
-        with Cursor(self) as c:
-            c.execute("SELECT DISTINCT name FROM objects INNER JOIN characters "
-                      "ON characters.obj == objects.id "
-                      "AND characters.username == ?", (username,))
-            return [row[0] for row in c.fetchall()]
+        self._flush_saves()
+        with self._reader() as conn:
+            return _scalar_cursor(conn).execute(SQL_GET_USER_CHARACTERS, (username,)).fetchall()
 
     def create_character(self, username, charname):
         """
@@ -112,25 +507,38 @@ class Sqlite(object):
         :param charname: The name of the character to create.
         :return: The ID of the new character, or None if it could not be created.
         """
-        with Cursor(self) as c:
+        now = int(time.time())
+        new_character_room = 0
+
+        def create(conn):
+            # The writer runs all of this as one job, which is rolled back if anything fails.
             # First, create the Player. This will fail (due to database constraints) if the name is in use.
-            now = time.time()
-            new_character_room = 0
-            try:
-                c.execute("BEGIN TRANSACTION")
-                c.execute("INSERT OR ROLLBACK INTO objects VALUES (NULL, ?, 1, 0, ?, 1, NULL, 0, ?, ?, ?)",
-                          (charname, new_character_room, now, now, now)
-                          )
-                log.trace("Created object in database.")
-                obj_id = c.lastrowid
-                c.execute("UPDATE OR ROLLBACK objects SET owner=? WHERE id=?", (obj_id, obj_id))
-                log.trace("Updated object owner to self.")
-                c.execute("INSERT OR ROLLBACK INTO characters VALUES (?, ?)", (username, obj_id))
-                c.execute("COMMIT")
-                log.trace(f"Successful: INSERT INTO characters VALUES ({username!r}, {charname!r});")
-            except sqlite3.IntegrityError as e:
-                log.trace(f"Integrity error: {e}. Rolled back transaction.")
-                return None
+            obj_id = conn.execute(SQL_CREATE_PLAYER, (charname, new_character_room, now, now, now)).fetchone()[0]
+            log.trace("Created object in database.")
+            conn.execute(SQL_ADD_CHARACTER, (username, obj_id))
+            return obj_id
+
+        try:
+            obj_id = self._write(create, wait=True)
+        except sqlite3.IntegrityError as e:
+            log.trace("Integrity error: %s. Rolled back transaction.", e)
+            return None
+        log.trace("Successful: INSERT INTO characters VALUES (%r, %r);", username, charname)
+        self._forget_object(obj_id)
+        return obj_id
+
+    def _forget_object(self, obj):
+        """
+        Drops everything that is cached or buffered about an object, after its row has been replaced.
+        """
+        self._object_cache.invalidate(obj)
+        # The object that used to have this ID may have been an Action, in an unknown location.
+        self._action_cache.clear()
+        self._save_buffer.pop(obj, None)
+        for key in [key for key in self._prop_cache.data if key[0] == obj]:
+            self._prop_cache.invalidate(key)
+        for key in [key for key in self._prop_buffer if key[0] == obj]:
+            del self._prop_buffer[key]
 
     def get_player_id(self, username, charname):
         """
@@ -138,52 +546,209 @@ class Sqlite(object):
         id of the matching Player record from the Things table if the
         character exists. If it does not exist, None is returned.
         """
-        with Cursor(self) as c:
-            c.execute("SELECT id FROM objects INNER JOIN characters ON characters.obj == objects.id "
-                      "AND characters.username == ? AND objects.name == ?", (username, charname))
-            return c.fetchone()[0]
+        self._flush_saves()
+        return self._fetchone(SQL_GET_PLAYER_ID, (username, charname), scalar=True)
 
     def get_property(self, obj, key):
         """
         This method returns the value of the property named "key"
         on the object whose id is "obj".
         """
-        with Cursor(self) as c:
-            c.execute("""SELECT value FROM properties WHERE obj==? AND key==?""", (obj, key))
-            result = c.fetchone()
-            return result[0] if result else None
+        # Writes that haven't been flushed yet are newer than anything in the database.
+        if (obj, key) in self._prop_buffer:
+            return self._prop_buffer[obj, key]
+        value = self._prop_cache.get((obj, key))
+        if value is _LRUCache.MISSING:
+            value = self._fetchone(SQL_GET_PROPERTY, (obj, key), scalar=True)
+            self._prop_cache.put((obj, key), value)
+        return value
+
+    def get_properties(self, obj, keys):
+        """
+        This method returns the values of several properties of the
+        object whose id is "obj", as a dict keyed on property name.
+        Properties that don't exist have the value None.
+        """
+        values = {}
+        missing = []
+        for key in keys:
+            if (obj, key) in self._prop_buffer:
+                values[key] = self._prop_buffer[obj, key]
+            else:
+                value = self._prop_cache.get((obj, key))
+                if value is _LRUCache.MISSING:
+                    missing.append(key)
+                else:
+                    values[key] = value
+        if missing:
+            found = {}
+            with self._reader() as conn:
+                for i in range(0, len(missing), MAX_IN_PARAMS):
+                    chunk = missing[i:i + MAX_IN_PARAMS]
+                    sql = SQL_GET_PROPERTIES.format(','.join('?' * len(chunk)))
+                    found.update(conn.execute(sql, [obj] + chunk))
+            for key in missing:
+                values[key] = found.get(key)
+                self._prop_cache.put((obj, key), values[key])
+        return values
+
+    def get_many_properties(self, ids, keys):
+        """
+        This method returns the values of the same properties of many
+        objects at once, as a dict keyed on object id. Each value is a
+        dict keyed on property name, as returned by get_properties().
+        """
+        keys = tuple(keys)
+        values = {}
+        missing = []
+        for obj in ids:
+            props = values[obj] = {}
+            for key in keys:
+                if (obj, key) in self._prop_buffer:
+                    props[key] = self._prop_buffer[obj, key]
+                else:
+                    value = self._prop_cache.get((obj, key))
+                    if value is not _LRUCache.MISSING:
+                        props[key] = value
+            if len(props) < len(keys):
+                missing.append(obj)
+        if missing:
+            found = {}
+            step = max(1, MAX_IN_PARAMS - len(keys))
+            with self._reader() as conn:
+                for i in range(0, len(missing), step):
+                    chunk = missing[i:i + step]
+                    sql = SQL_GET_MANY_PROPERTIES.format(','.join('?' * len(chunk)), ','.join('?' * len(keys)))
+                    for obj, key, value in conn.execute(sql, chunk + list(keys)):
+                        found[obj, key] = value
+            for obj in missing:
+                props = values[obj]
+                for key in keys:
+                    if key not in props:
+                        props[key] = found.get((obj, key))
+                        self._prop_cache.put((obj, key), props[key])
+        return values
 
     def set_property(self, obj, key, val):
         """
         This method sets the value of the property named "key" on
         the object whose id is "obj" to the value "val".
+
+        The write is buffered, and reaches the database on the next flush().
         """
-        with Cursor(self) as c:
-            c.execute("""INSERT OR REPLACE INTO properties VALUES (?, ?, ?)""", (obj, key, val))
+        self.set_properties(((obj, key, val),))
+
+    def set_properties(self, rows):
+        """
+        This method sets many properties at once. Takes an iterable of
+        (obj, key, val) tuples.
+
+        The writes are buffered, and reach the database together on the next flush().
+        """
+        for obj, key, val in rows:
+            self._prop_buffer[obj, key] = val
+            self._prop_cache.invalidate((obj, key))
+        if len(self._prop_buffer) >= PROPERTY_BUFFER_SIZE:
+            self.flush()
 
     def load_object(self, obj):
-        with Cursor(self) as c:
-            c.execute("SELECT type, name, flags, parent, owner, link, money, "
-                      "created, modified, lastused FROM objects WHERE id==?", (obj,))
-            return c.fetchone()
+        row = self._object_cache.get(obj)
+        if row is _LRUCache.MISSING:
+            self._flush_saves()
+            row = self._fetchone(SQL_LOAD_OBJECT, (obj,))
+            if row is not None:
+                self._cache_desc(obj, row[-1])
+                row = row[:-1]
+            self._object_cache.put(obj, row)
+        return row
+
+    def load_objects(self, ids):
+        """
+        Loads many objects at once, using as few queries as possible.
+
+        Returns a dict mapping each id that exists to its row, as returned by load_object().
+        """
+        rows = {}
+        missing = []
+        for obj in ids:
+            row = self._object_cache.get(obj)
+            if row is _LRUCache.MISSING:
+                missing.append(obj)
+            elif row is not None:
+                rows[obj] = row
+        if missing:
+            self._flush_saves()
+            with self._reader() as conn:
+                for i in range(0, len(missing), MAX_IN_PARAMS):
+                    chunk = missing[i:i + MAX_IN_PARAMS]
+                    sql = SQL_LOAD_OBJECTS.format(','.join('?' * len(chunk)))
+                    for row in conn.execute(sql, chunk):
+                        self._cache_desc(row[0], row[-1])
+                        rows[row[0]] = row[1:-1]
+                        self._object_cache.put(row[0], row[1:-1])
+        return rows
+
+    def _cache_desc(self, obj, desc):
+        """
+        Caches the description that was loaded along with an object, unless a newer one is waiting to be flushed.
+        """
+        if (obj, '_/desc') not in self._prop_buffer:
+            self._prop_cache.put((obj, '_/desc'), desc)
 
     def save_object(self, thing):
+        """
+        Saves the basic data of a Thing.
+
+        The save is buffered, and reaches the database on the next flush(). Saving the same
+        Thing again before then just replaces the buffered values.
+        """
         # NOTE: Should database drivers have ANY knowledge about Things?
-        with Cursor(self) as c:
-            # Note: Will fail if the row being updated does not match the dbtype of the Thing provided.
-            # NOTE: Should we use INSERT OR REPLACE INTO instead?
-            c.execute("UPDATE objects SET parent=?, owner=?, name=?, flags=?, link=?, money=?,"
-                      "modified=?, lastused=?, desc=? WHERE id==? AND type==?",
-                      (thing.parent.id, thing.owner.id, thing.name, thing.flags, thing.link.id if thing.link else None,
-                       thing.money, thing.modified, thing.lastused, thing.desc, thing.id, int(thing.dbtype)))
+        # Note: Will fail if the row being updated does not match the dbtype of the Thing provided.
+        self._object_cache.invalidate(thing.id)
+        dirty = frozenset(thing._dirty_fields)
+        if thing.id in self._save_buffer:
+            # Fields changed by an earlier save that hasn't been flushed still need to be written.
+            dirty |= self._save_buffer[thing.id][0]
+        row = (thing.parent.id, thing.owner.id, thing.name, thing.flags, thing.link.id if thing.link else None,
+               thing.money, int(thing.modified), int(thing.lastused), thing.id, int(thing.dbtype))
+        self._save_buffer[thing.id] = (dirty, row)
+        if 'parent' in dirty and row[9] == ACTION_TYPE:
+            # An Action has moved. Its old location isn't known here, and Actions are seldom moved,
+            # so just start the action cache over.
+            self._action_cache.clear()
+        if len(self._save_buffer) >= SAVE_BUFFER_SIZE:
+            self.flush()
 
     def get_contents(self, obj):
         """
         Returns a list of database IDs of objects contained by this object.
         """
-        with Cursor(self) as c:
-            c.execute("""SELECT id FROM objects WHERE parent==?""", (obj,))
-            return tuple(map(lambda x: x[0], c.fetchall()))
+        self._flush_saves()
+        with self._reader() as conn:
+            return _scalar_cursor(conn).execute(SQL_GET_CONTENTS, (obj,)).fetchall()
+
+    def get_contents_by_type(self, obj, dbtype):
+        """
+        Returns a list of database IDs of objects of the given type contained by this object.
+        """
+        if dbtype == ACTION_TYPE:
+            ids = self._action_cache.get(obj)
+            if ids is not _LRUCache.MISSING:
+                return list(ids)
+        self._flush_saves()
+        with self._reader() as conn:
+            ids = _scalar_cursor(conn).execute(SQL_GET_CONTENTS_BY_TYPE, (obj, dbtype)).fetchall()
+        if dbtype == ACTION_TYPE:
+            self._action_cache.put(obj, tuple(ids))
+        return ids
+
+    def get_contents_with_flags(self, obj):
+        """
+        Returns a list of (id, type, flags) tuples for the objects contained by this object.
+        """
+        self._flush_saves()
+        with self._reader() as conn:
+            return conn.execute(SQL_GET_CONTENTS_WITH_FLAGS, (obj,)).fetchall()
 
     def create_user(self, username, password, pubkeys):
         # TODO: Issue #3: Implement me!
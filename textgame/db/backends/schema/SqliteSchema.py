@@ -1,8 +1,11 @@
+from contextlib import contextmanager
 from textwrap import dedent
 import time
 import sqlite3
 from typing import Iterable, Tuple
 
+from textgame.Util import log
+
 
 class Schema(object):
     # Stores CREATE TABLE statements.
@@ -32,10 +35,10 @@ class Schema(object):
                 link INTEGER DEFAULT NULL,        -- Link to another object (home, or action). Null if unlinked.
                 money INTEGER DEFAULT 0 NOT NULL, -- Amount of currency that this object contains
                 
-                -- The following timestamps are in unix time:
-                created INTEGER DEFAULT (strftime('%s','now')),  -- Time of creation
-                modified INTEGER DEFAULT (strftime('%s','now')), -- Time last modified in any way
-                lastused INTEGER DEFAULT (strftime('%s','now')), -- Time last used (without modifying it)
+                -- The following timestamps are in unix time, and are always provided by the server:
+                created INTEGER NOT NULL,         -- Time of creation
+                modified INTEGER NOT NULL,        -- Time last modified in any way
+                lastused INTEGER NOT NULL,        -- Time last used (without modifying it)
 
                 FOREIGN KEY(parent) REFERENCES objects(id),
                 FOREIGN KEY(owner) REFERENCES objects(id),
@@ -65,9 +68,12 @@ class Schema(object):
                 username TEXT,              -- Username that owns this character
                 obj INTEGER,                -- Reference to the Player object of the character
 
+                -- The primary key stops the same pairing being added twice, and clusters
+                -- the table on username, so a user's characters are stored together.
+                PRIMARY KEY(username, obj),
                 FOREIGN KEY(username) REFERENCES users(username),
                 FOREIGN KEY(obj) REFERENCES objects(id)
-            )""",
+            ) WITHOUT ROWID""",
         
         "properties": """
             CREATE TABLE IF NOT EXISTS properties (
@@ -77,22 +83,29 @@ class Schema(object):
                 -- At a database level, key names are arbitrary, but the server uses a
                 -- directory structure maintained using a naming convention for the keys.
 
+                -- The table is clustered on (obj, key), so a property lookup is a single B-tree search.
+                -- The primary key also ensures that an object cannot have the same key twice,
+                -- which ensures our INSERT OR REPLACE statement will work correctly.
+
                 obj INTEGER,        -- ID of object
                 key TEXT,           -- Name of this property
                 value TEXT,         -- Value of this property
 
+                PRIMARY KEY(obj, key),
                 FOREIGN KEY(obj) REFERENCES objects(id)
-            )""",
+            ) WITHOUT ROWID""",
 
         "deleted": """
             CREATE TABLE IF NOT EXISTS deleted (
                 -- This single-column table allows objects to be marked as deleted.
                 -- This allows ID values to be reused.
                 -- It also potentially allows recycled objects to be recovered.
+                -- obj aliases the rowid, so the table is kept sorted by ID without a separate index,
+                -- and the lowest reusable ID can be found without a scan.
 
-                obj INTEGER, -- The ID of a deleted object
+                obj INTEGER PRIMARY KEY, -- The ID of a deleted object
 
-                FOREIGN KEY(obj) REFERENCES object(id)
+                FOREIGN KEY(obj) REFERENCES objects(id)
             )""",
         
         "locks": """
@@ -132,9 +145,12 @@ class Schema(object):
 
     indices = {
         "objects": ("""
-                CREATE INDEX IF NOT EXISTS parent_index ON objects(parent)
+                CREATE INDEX IF NOT EXISTS parent_index ON objects(parent, type, flags)
                     -- Contents of an object are determined by finding
                     -- all objects whose parent is the container.
+                    -- The index entries also hold the rowid (which id aliases), so
+                    -- listing contents, along with their types and flags, never has
+                    -- to read the table itself.
             """, """
                 CREATE INDEX IF NOT EXISTS owner_index ON objects(owner)
                     -- Allow looking up or filtering objects by owner.
@@ -145,19 +161,67 @@ class Schema(object):
                 CREATE UNIQUE INDEX IF NOT EXISTS unique_character_name ON objects(name COLLATE NOCASE) WHERE type=1
                     -- Enforce unique character names
             """),
-        
-        "properties": ("""
-                CREATE UNIQUE INDEX IF NOT EXISTS key_index ON properties(obj, key)
-                    -- Properties are uniquely indexed by id-key pairing.
-                    -- This constraint ensures that an object cannot have the same key twice,
-                    -- which ensures our INSERT OR REPLACE statement will work correctly.
-            """,)
+    }
+
+    triggers = {
+        "objects": ("""
+                CREATE TRIGGER IF NOT EXISTS reuse_deleted AFTER UPDATE OF created ON objects
+                    WHEN EXISTS (SELECT 1 FROM deleted WHERE obj == NEW.id)
+                BEGIN
+                    -- A new object has been written over a deleted one, so that ID is no longer
+                    -- free, and the properties of the deleted object are of no further use.
+                    -- If the deleted object was a Player, its user must not be able to log in as the new one.
+                    DELETE FROM deleted WHERE obj == NEW.id;
+                    DELETE FROM properties WHERE obj == NEW.id;
+                    DELETE FROM characters WHERE obj == NEW.id;
+                END
+            """,),
     }
 
     # This is a tuple, each item is a tuple of SQL statements.
+    # A new database is created at the latest version, so these only run against older databases.
     upgrades = (
-        # Upgrade to Schema 1
-        ("ALTER TABLE objects ADD health INTEGER")
+        # Upgrade to Schema 1: Rebuild properties as a WITHOUT ROWID table.
+        # Dropping the old table also drops its key_index and props_cover indexes.
+        (
+            "ALTER TABLE properties RENAME TO properties_old",
+            tables["properties"],
+            "INSERT INTO properties SELECT obj, key, value FROM properties_old",
+            "DROP TABLE properties_old",
+        ),
+        # Upgrade to Schema 2: Rebuild deleted keyed on obj, and point its foreign key at the right table.
+        (
+            "ALTER TABLE deleted RENAME TO deleted_old",
+            tables["deleted"],
+            "INSERT OR IGNORE INTO deleted SELECT obj FROM deleted_old WHERE obj IS NOT NULL",
+            "DROP TABLE deleted_old",
+        ),
+        # Upgrade to Schema 3: Older databases stored some timestamps as floats. Make them all integers.
+        (
+            """UPDATE objects SET created=CAST(created AS INTEGER), modified=CAST(modified AS INTEGER),
+                lastused=CAST(lastused AS INTEGER)
+                WHERE typeof(created)=='real' OR typeof(modified)=='real' OR typeof(lastused)=='real'""",
+        ),
+        # Upgrade to Schema 4: Reusing a deleted ID cleans up after itself.
+        triggers["objects"],
+        # Upgrade to Schema 5: Widen parent_index so that it covers the type and flags of the contents.
+        (
+            "DROP INDEX parent_index",
+            indices["objects"][0],
+        ),
+        # Upgrade to Schema 6: Key characters on (username, obj), dropping the duplicate
+        # rows that were added each time the server started.
+        (
+            "ALTER TABLE characters RENAME TO characters_old",
+            tables["characters"],
+            "INSERT OR IGNORE INTO characters SELECT username, obj FROM characters_old",
+            "DROP TABLE characters_old",
+        ),
+        # Upgrade to Schema 7: Reusing a deleted ID also takes it away from the user whose character it was.
+        (
+            "DROP TRIGGER IF EXISTS reuse_deleted",
+            triggers["objects"][0],
+        ),
     )
 
     def __init__(self, cursor):
@@ -169,27 +233,76 @@ class Schema(object):
         # Execute CREATE TABLE statement
         self.cursor.execute(dedent(self.tables[tablename]).strip())
 
-        if tablename in self.indices:
-            # Create any indexes that this table has.
-            for item in self.indices[tablename]:
-                self.cursor.execute( dedent(item).strip() )
-
         if len(values) > 0:
             # Create insert statement. Make some question marks separated by commas.
             insert = f"INSERT OR IGNORE INTO {tablename} VALUES({','.join('?'*len(values[0]))})"
             # Execute insert statement.
             self.cursor.executemany(insert, values)
 
+        if tablename in self.indices:
+            # Create any indexes that this table has. This is done after inserting the initial data,
+            # so that each index is built once from the finished table.
+            for item in self.indices[tablename]:
+                self.cursor.execute( dedent(item).strip() )
+
+        if tablename in self.triggers:
+            # Create any triggers on this table.
+            for item in self.triggers[tablename]:
+                self.cursor.execute(dedent(item).strip())
+
     def create(self):
-        # Meta table.
-        self._create_table("meta", [('schema_version', 0)])
+        """
+        Creates any missing tables and fills them with the initial data.
 
-        # 0: Universal parent room (has to be created owning itself due to constraints)
+        All of the statements run inside a single transaction, so the
+        database only has to be synced to disk once.
+
+        An existing database already has a schema version, and is left
+        alone; upgrade() takes care of bringing it up to date.
+
+        The initial data is only inserted into a new database. It is not
+        put back if it is removed later: IDs are reused once an object is
+        deleted, so a seeded property or character row could end up
+        attached to an unrelated object.
+        """
+        try:
+            self.cursor.execute("SELECT value FROM meta WHERE key='schema_version'")
+            if self.cursor.fetchone() is not None:
+                return
+        except sqlite3.OperationalError:
+            # No meta table, so this is a new database.
+            pass
+        with self._transaction():
+            self._create_tables()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs the body of a "with" statement in a transaction, which is
+        committed at the end, or rolled back if an exception is raised.
+        """
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.cursor.execute("ROLLBACK")
+            raise
+        self.cursor.execute("COMMIT")
+
+    def _create_tables(self):
+        # Meta table. A new database starts out at the latest schema version.
+        self._create_table("meta", [('schema_version', len(self.upgrades))])
+
+        # 0: Universal parent room, owned by the admin player
         # 1: Admin player
-        now = time.time()
+        # The room and the player refer to each other, so foreign keys are only checked
+        # when the transaction commits (this pragma switches itself off again at that point).
+        self.cursor.execute("PRAGMA defer_foreign_keys = ON")
+        # Timestamps are whole unix seconds, as the server always writes them. A float would be stored as a REAL.
+        now = int(time.time())
         self._create_table("objects", [
             # id name           typ flg par own link  $  cre. mod. used
-            (0, 'The Universe',  0,  0,  0,  0, None, 0, now, now, now),
+            (0, 'The Universe',  0,  0,  0,  1, None, 0, now, now, now),
             (1, 'The Creator',   1,  0,  0,  1, None, 0, now, now, now),
             # Other test objects (for testing)
             (2, 'no tea',        2,  0,  1,  1,  1,   0, now, now, now),
@@ -198,9 +311,6 @@ class Schema(object):
             (5, 'Guest',         1,  0,  0,  5, None, 0, now, now, now)
         ])
 
-        # Update the universal room so that the admin player owns it
-        self.cursor.execute("""UPDATE objects SET owner=1 WHERE id=0""")
-
         # Properties table
         self._create_table("properties", [
             (0, '_/desc', "You can't hear anything, see anything, smell anything, " +
@@ -235,18 +345,10 @@ class Schema(object):
         # What is the current schema version of the database?
         self.cursor.execute("SELECT value FROM meta WHERE key='schema_version'")
         current = int(self.cursor.fetchone()[0])
-        upgrades = self.upgrades[current:]
-        for upgrade in upgrades:
-            log.info(f"Upgrading schema: {current} => {current+1}")
-            try:
-                with self.cursor.connection:
-                    for statement in upgrade:
-                        self.cursor.execute(statement)
-                    current += 1
-                    self.cursor.execute("REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (current,))
-            except sqlite3.IntegrityError:
-                pass
-    
-    def get_tables(self):
-        self.cursor.execute("""SELECT name FROM sqlite_master WHERE type='table'""")
-        return [str(x[0]) for x in self.cursor.fetchall()]
+        for upgrade in self.upgrades[current:]:
+            log.info("Upgrading schema: %d => %d", current, current + 1)
+            with self._transaction():
+                for statement in upgrade:
+                    self.cursor.execute(dedent(statement).strip())
+                current += 1
+                self.cursor.execute("REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (current,))